@@ -0,0 +1,339 @@
+"""tool.py 的性能测试。使用本目录下的 27 卷书、fenci.csv 和原文文本。
+
+用法：
+    python bench.py                         # 运行全部项目，结果输出到屏幕
+    python bench.py -o result.json          # 同时保存为 JSON，便于不同提交之间比较
+    python bench.py --compare base.json     # 与之前保存的结果比较
+    python bench.py --only fenci get_verse  # 只运行部分项目
+    python bench.py --check                 # 先核对索引查找的结果，不一致时不计时
+
+每个项目先预热 `--warmup` 次，再计时 `--repeat` 次；
+计时结束后另外运行一次，用 tracemalloc 统计该项目的内存峰值。
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import pathlib
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = pathlib.Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+
+from tool import *
+
+
+def _book_paths(folder: str) -> list[str]:
+    """某目录下按编号排列的 1~27 卷书，不含封面。"""
+    paths = []
+    for path in (HERE / folder).glob("*.md"):
+        match = re.match(r"(\d+)、", path.name)
+        if match and int(match.group(1)) > 0:
+            paths.append((int(match.group(1)), str(path)))
+    return [path for (_, path) in sorted(paths)]
+
+
+class Context:
+    """各项目共用的数据，只在第一次用到时加载。"""
+
+    def __init__(self) -> None:
+        self.trans_paths = _book_paths("漢字對照")
+        self.origin_paths = _book_paths("原文")
+        self._tmp = tempfile.TemporaryDirectory(prefix="bench-")   # 退出时自动删除
+        self.tmp_dir = pathlib.Path(self._tmp.name)
+        self._books = None
+        self._fenci = None
+        self._fenzi = None
+
+    @property
+    def books(self) -> Books:
+        if self._books is None:
+            self._books = load_trans_books(*self.trans_paths)
+        return self._books
+
+    @property
+    def fenci(self) -> Counter:
+        if self._fenci is None:
+            self._fenci = load_fenci_csv(str(HERE / "fenci.csv"))
+        return self._fenci
+
+    @property
+    def fenzi(self) -> Counter:
+        if self._fenzi is None:
+            self._fenzi = self.books.fenci(zi=True)
+        return self._fenzi
+
+    def verses(self, limit: int=None) -> list[Verse]:
+        verses = [verse for book in self.books for chapter in book.chapters for verse in chapter.verses]
+        return verses[:limit]
+
+
+# 各项目：(名称, 准备函数, 计时函数)。准备函数不计时，每次计时前都会调用。
+
+def _stage_load(ctx: Context):
+    load_trans_books(*ctx.trans_paths)
+
+def _setup_fenci(ctx: Context):
+    ctx.books.__dict__.pop("_fenci_cache", None)  # 不使用统计缓存
+
+def _stage_fenci(ctx: Context):
+    ctx.books.fenci()
+
+def _stage_fenzi(ctx: Context):
+    ctx.books.fenci(zi=True)
+
+_CI_QUERIES = [("pi-kao", "被告"), ("ge", "渠"), ("Yia-su", "耶穌"), ("Kyi-toh", "基督"), ("nying", "人")]
+
+def _stage_find_ci_pair(ctx: Context):
+    for (lat, han) in _CI_QUERIES:
+        ctx.books.find_ci_pair(lat, han)
+
+_ZI_QUERIES = [(None, "耶穌"), ("yia su", None), ("Yia-su", "耶穌"), ("kao ts'ing", None), (None, "上帝"), ("ge", "渠")]
+
+def _stage_search_zi(ctx: Context):
+    for (lat, han) in _ZI_QUERIES:
+        ctx.books.search_zi(lat, han)
+
+def _stage_get_verse(ctx: Context):
+    books = ctx.books
+    for book_no, book in enumerate(books, 1):
+        for chapter_no, chapter in enumerate(book.chapters, 1):
+            for verse_no in range(len(chapter.verses)):
+                books.get_verse(book_no, chapter_no, verse_no)
+
+def _stage_lazy_get_verse(ctx: Context):
+    # 每次新建，相当于脚本启动后只查几个小节；不使用缓存目录，包含扫描行偏移的时间
+    books = load_trans_books(*ctx.trans_paths, lazy=True)
+    for (book_no, chapter_no, verse_no) in ((1, 5, 3), (4, 3, 16), (6, 8, 28), (19, 11, 1), (27, 22, 21)):
+        books.get_verse(book_no, chapter_no, verse_no)
+
+def _stage_lat2han(ctx: Context):
+    l2h = Lat2Han(ctx.fenci)
+    for verse in ctx.verses(2000):
+        lat2han(verse.lat, l2h)
+
+def _stage_han2lat(ctx: Context):
+    h2l = Han2Lat(ctx.fenzi)
+    for verse in ctx.verses(500):
+        han2lat(verse.han, h2l)
+
+def _stage_validate_punc(ctx: Context):
+    for path in ctx.origin_paths:
+        validate_origin_punc(path)
+
+def _setup_generate(ctx: Context):
+    (ctx.tmp_dir / "generate.md").unlink(missing_ok=True)
+
+def _stage_generate(ctx: Context):
+    generate_trans_file(ctx.origin_paths[0], str(ctx.tmp_dir / "generate.md"), ctx.fenci)
+
+STAGES = [
+    ("load_trans_books", None, _stage_load),
+    ("fenci", _setup_fenci, _stage_fenci),
+    ("fenzi", _setup_fenci, _stage_fenzi),
+    ("find_ci_pair", None, _stage_find_ci_pair),
+    ("search_zi", None, _stage_search_zi),
+    ("get_verse", None, _stage_get_verse),
+    ("lazy_get_verse", None, _stage_lazy_get_verse),
+    ("lat2han", None, _stage_lat2han),
+    ("han2lat", None, _stage_han2lat),
+    ("validate_origin_punc", None, _stage_validate_punc),
+    ("generate_trans_file", _setup_generate, _stage_generate),
+]
+
+
+# 核对项目：返回不一致之处的说明，空列表表示通过。
+
+def _scan_zi(books: Books, lat: str|None, han: str|None) -> list[tuple]:
+    """不用索引和 `Verse.tokens()`，逐小节重新分字查找，作为 `search_zi` 的对照。"""
+    q_lat = Books._re_lat_zi.findall(lat.lower()) if lat is not None else None
+    q_han = Books._re_han_zi.findall(han) if han is not None else None
+    size = len(q_lat if q_lat is not None else q_han)
+    found = []
+    for book_no, book in enumerate(books, 1):
+        for chapter_no, chapter in enumerate(book.chapters, 1):
+            for verse_no, verse in enumerate(chapter.verses):
+                lat_zi = Books._re_lat_zi.findall(VerseTokens._mask_notes(verse.lat.lower()))
+                han_zi = Books._re_han_zi.findall(verse.han)
+                if len(lat_zi) != len(han_zi):
+                    continue
+                start = 0
+                while start + size <= len(lat_zi):
+                    end = start + size
+                    if ((q_lat is None or lat_zi[start:end] == q_lat)
+                            and (q_han is None or han_zi[start:end] == q_han)):
+                        found.append((book_no, chapter_no, verse_no, " ".join(lat_zi[start:end]), "".join(han_zi[start:end])))
+                        start = end
+                    else:
+                        start += 1
+    return found
+
+def _check_search_zi(ctx: Context) -> list[str]:
+    problems = []
+    for (lat, han) in _ZI_QUERIES:
+        got = [(p.book_no, p.chapter_no, p.verse_no, p.lat, p.han) for p in ctx.books.search_zi(lat, han)]
+        expected = _scan_zi(ctx.books, lat, han)
+        if got != expected:
+            problems.append(f"search_zi({lat!r}, {han!r}): 找到 {len(got)} 处，逐节查找为 {len(expected)} 处")
+    return problems
+
+def _merged_book(ctx: Context, no: int, trans_text: str) -> str:
+    """把译文文件改成 `trans_text` 后与原文合并，返回合并结果。"""
+    origin_path = next(path for path in ctx.origin_paths if pathlib.Path(path).name.startswith(f"{no}、"))
+    trans_path = ctx.tmp_dir / "merge.md"
+    trans_path.write_text(trans_text, encoding="utf-8")
+    with contextlib.redirect_stdout(io.StringIO()):
+        generate_trans_file(origin_path, str(trans_path), merge=True)
+    return trans_path.read_text(encoding="utf-8")
+
+def _check_merge_footnotes(ctx: Context) -> list[str]:
+    problems = []
+    # 原文和译文都有脚注区：已有脚注保留行尾空格，译者另加的脚注（连同续行）保留在末尾
+    text = pathlib.Path(ctx.trans_paths[4]).read_text(encoding="utf-8")
+    last = text.rindex("\n[^") + 1
+    last = text.index("\n", last) + 1
+    text = text[:last] + "[^2-1]: 譯者註。  \n另見 1.11。\n" + text[last:]
+    if _merged_book(ctx, 5, text) != text:
+        problems.append("使徒行傳：合并后脚注区与已有译文不同")
+    # 只有译文有脚注区：整个脚注区原样保留
+    text = pathlib.Path(ctx.trans_paths[13]).read_text(encoding="utf-8")
+    text += "------\n譯者註：\n[^1-3]: 譯者註。  \n"
+    if _merged_book(ctx, 14, text) != text:
+        problems.append("帖撒羅尼迦書信 2：合并后丢失了只在译文中的脚注区")
+    return problems
+
+def _check_records(ctx: Context) -> list[str]:
+    """字典式访问只能用 `_fields` 中的键，`path`、`_tokens` 等属性不行。"""
+    problems = []
+    book = ctx.books[0]
+    verse = book.chapters[0].verses[1]
+    verse.tokens()
+    for (record, key) in ((book, "path"), (verse, "_tokens")):
+        try:
+            record[key]
+        except KeyError:
+            pass
+        else:
+            problems.append(f"{type(record).__name__}[{key!r}] 没有报 KeyError")
+        if record.get(key) is not None or key in record:
+            problems.append(f"{type(record).__name__}.get({key!r}) 或 in 能取到非公开属性")
+    if book["chapters"] is not book.chapters or verse["lat"] is not verse.lat:
+        problems.append("字典式访问取不到公开属性")
+    return problems
+
+CHECKS = [
+    ("search_zi", _check_search_zi),
+    ("merge_footnotes", _check_merge_footnotes),
+    ("records", _check_records),
+]
+
+
+def run_stage(ctx: Context, setup, func, warmup: int, repeat: int) -> dict:
+    """运行一个项目，返回计时和内存峰值。项目中的输出都会被丢弃。"""
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(warmup + repeat):
+            if setup is not None:
+                setup(ctx)
+            start = time.perf_counter()
+            func(ctx)
+            elapsed = time.perf_counter() - start
+            if i >= warmup:
+                times.append(elapsed)
+        # 单独运行一次统计内存，避免 tracemalloc 影响计时
+        if setup is not None:
+            setup(ctx)
+        tracemalloc.start()
+        try:
+            func(ctx)
+            (_, peak) = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {
+        "times": times,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def _git_commit() -> str|None:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def main(argv: list[str]=None) -> int:
+    names = [name for (name, _, _) in STAGES]
+    parser = argparse.ArgumentParser(prog="bench.py", description="tool.py 性能测试")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="计时次数")
+    parser.add_argument("-w", "--warmup", type=int, default=1, help="预热次数")
+    parser.add_argument("-o", "--output", help="把结果保存为 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果比较")
+    parser.add_argument("--only", nargs="+", choices=names, metavar="STAGE",
+                        help=f"只运行这些项目: {', '.join(names)}")
+    parser.add_argument("--check", action="store_true", help="计时前先核对查找结果")
+    args = parser.parse_args(argv)
+
+    ctx = Context()
+    if args.check:
+        failed = False
+        for (name, check) in CHECKS:
+            problems = check(ctx)
+            print(f"{'🟢' if not problems else '🔴'} 核对 {name}")
+            for problem in problems:
+                print(f"    {problem}")
+            failed = failed or bool(problems)
+        if failed:
+            return 1
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["stages"]
+
+    results = {}
+    print(f"{'项目':<22}{'最短(ms)':>10}{'中位(ms)':>10}{'峰值(KiB)':>12}")
+    for (name, setup, func) in STAGES:
+        if args.only and name not in args.only:
+            continue
+        result = results[name] = run_stage(ctx, setup, func, args.warmup, args.repeat)
+        line = f"{name:<24}{result['min']*1000:>10.1f}{result['median']*1000:>10.1f}{result['peak_kib']:>12.1f}"
+        if baseline is not None and name in baseline:
+            ratio = result["median"] / baseline[name]["median"]
+            mark = "🟢" if ratio < 0.95 else "🔴" if ratio > 1.05 else "⚪"
+            line += f"  {mark} x{ratio:.2f}"
+        print(line)
+
+    if args.output:
+        report = {
+            "meta": {
+                "commit": _git_commit(),
+                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "warmup": args.warmup,
+                "repeat": args.repeat,
+            },
+            "stages": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
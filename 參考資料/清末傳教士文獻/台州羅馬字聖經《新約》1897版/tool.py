@@ -1,11 +1,218 @@
+import abc
+import argparse
+import array
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import csv
+import difflib
+import functools
+import hashlib
+import http.server
+import inspect
+import io
+import itertools
+import json
+import math
+import os
 import pathlib
+import pickle
 import re
+import sys
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.parse
+import urllib.request
 from collections import Counter
+from typing import NamedTuple
 
 # RE_HAN = r"[\u2E80-\u2FFF\u3007\u31C0-\u31EF\u3400-\u4DBF\u4E00-\u9FFF\uF900-\uFAFF"\
 #          r"\U00020000-\U0002A6DF\U0002A700-\U0002EE5F\U0002F800-\U0002FA1F\U00030000-\U000323AF]"
 RE_HAN = r"\{.+?\}|[\u4E00-\u9FA5❓□㾎𧮙䫲𤖼𠡒𣥼䂸㔶䥛䀹㬹㧒詨]"
 
+
+class Profiler:
+    """可选的性能统计。默认关闭，开启后记录各阶段的耗时、各书的行数和小节数、
+    正则扫描次数以及各缓存的命中率，不需要修改其他代码。
+
+    使用方式:
+        ```
+        with Profiler() as prof:
+            books = load_trans_books(...)
+            books.fenci()
+        prof.print_summary()            # 输出表格
+        prof.write_json("profile.json") # 或保存为 JSON
+        ```
+        `Profiler(cprofile="fenci")` 会同时用 cProfile 分析该阶段，结果见 `prof.cprofile`，
+        可用 `prof.dump_cprofile(path)` 保存后用 `python -m pstats` 或 snakeviz 查看。
+
+    也可以设置环境变量 `TOOL_PROFILE`，在导入本模块时开启，程序结束时输出结果：
+        `TOOL_PROFILE=1` 输出表格；`TOOL_PROFILE=xxx.json` 保存为 JSON。
+        `TOOL_PROFILE_CPROFILE=阶段名` 另外把该阶段的 cProfile 结果保存为 `阶段名.prof`。
+    ---
+    多进程（`workers` 大于 1）时，子进程中的统计不会计入。
+    """
+
+    def __init__(self, cprofile: str=None) -> None:
+        self.stages = {}    # {(阶段, 细分): [次数, 总耗时, 最长耗时]}，细分通常是书的路径
+        self.counts = Counter()
+        self.books = {}     # {路径: {'lines': 行数, 'chapters': 章数, 'verses': 小节数}}
+        self.cprofile_stage = cprofile
+        self.cprofile = None    # `cProfile.Profile`
+        self._depth = Counter()
+        self._previous = None
+
+    def __enter__(self) -> "Profiler":
+        global _profiler
+        self._previous = _profiler
+        _profiler = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        global _profiler
+        _profiler = self._previous
+
+    @contextlib.contextmanager
+    def stage(self, name: str, detail: str=None):
+        """记录一个阶段的耗时。`detail` 用于按书细分。同一记录嵌套时只计最外层。"""
+        key = (name, detail)
+        self._depth[key] += 1
+        outermost = self._depth[key] == 1
+        profile = None
+        if outermost and detail is None and name == self.cprofile_stage:
+            import cProfile
+            if self.cprofile is None:
+                self.cprofile = cProfile.Profile()
+            profile = self.cprofile
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profile is not None:
+                profile.disable()
+            self._depth[key] -= 1
+            if outermost:
+                record = self.stages.setdefault(key, [0, 0.0, 0.0])
+                record[0] += 1
+                record[1] += elapsed
+                record[2] = max(record[2], elapsed)
+
+    def cache_rates(self) -> dict[str, float]:
+        """各缓存的命中率。 {缓存名: 命中率}，由 `cache.xxx.hit`、`cache.xxx.miss` 计算。"""
+        rates = {}
+        for key in self.counts:
+            if key.startswith("cache.") and key.endswith(".hit"):
+                name = key[6:-4]
+                hit = self.counts[key]
+                total = hit + self.counts[f"cache.{name}.miss"]
+                rates[name] = hit / total if total else 0.0
+        for key in self.counts:
+            if key.startswith("cache.") and key.endswith(".miss"):
+                rates.setdefault(key[6:-5], 0.0)
+        return rates
+
+    def to_dict(self) -> dict:
+        return {
+            "stages": [{"stage": name, "detail": detail, "calls": calls,
+                        "total_s": total, "max_s": longest}
+                       for ((name, detail), (calls, total, longest)) in self.stages.items()],
+            "books": self.books,
+            "counts": dict(self.counts),
+            "cache_rates": self.cache_rates(),
+        }
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    def dump_cprofile(self, path: str) -> None:
+        if self.cprofile is None:
+            print("🟡 未记录 cProfile，请用 `Profiler(cprofile=阶段名)` 开启。")
+            return
+        self.cprofile.dump_stats(path)
+
+    def print_summary(self, file=None, top: int=10) -> None:
+        """以表格形式输出统计结果。每个阶段只列出耗时最多的 `top` 本书。"""
+        out = file if file is not None else sys.stdout
+        print(f"{'阶段':<28}{'次数':>6}{'总计(ms)':>12}{'最长(ms)':>12}", file=out)
+        # 先列出阶段，再在其下列出各书的细分，细分按耗时从多到少排列
+        names = list(dict.fromkeys(name for (name, _) in self.stages))
+        for name in names:
+            if (name, None) in self.stages:
+                (calls, total, longest) = self.stages[(name, None)]
+                print(f"{name:<30}{calls:>6}{total*1000:>12.1f}{longest*1000:>12.1f}", file=out)
+            details = [(detail, record) for ((n, detail), record) in self.stages.items()
+                       if n == name and detail is not None]
+            details.sort(key=lambda item: -item[1][1])
+            for (detail, (calls, total, longest)) in details[:top]:
+                label = pathlib.Path(detail).stem
+                print(f"    {label:<26}{calls:>6}{total*1000:>12.1f}{longest*1000:>12.1f}", file=out)
+            if len(details) > top:
+                print(f"    ……其余 {len(details) - top} 本", file=out)
+        if self.books:
+            print(f"\n{'书':<28}{'行':>8}{'章':>6}{'小节':>8}", file=out)
+            for (path, info) in self.books.items():
+                print(f"{pathlib.Path(path).stem:<28}{info.get('lines', '-'):>8}"
+                      f"{info.get('chapters', '-'):>6}{info.get('verses', '-'):>8}", file=out)
+        counts = {key: value for (key, value) in self.counts.items() if not key.startswith("cache.")}
+        if counts:
+            print("\n计数:", file=out)
+            for (key, value) in sorted(counts.items()):
+                print(f"  {key:<30}{value:>10}", file=out)
+        rates = self.cache_rates()
+        if rates:
+            print("\n缓存命中率:", file=out)
+            for (name, rate) in sorted(rates.items()):
+                hit = self.counts[f"cache.{name}.hit"]
+                miss = self.counts[f"cache.{name}.miss"]
+                print(f"  {name:<30}{rate:>9.1%}  (命中 {hit}，未命中 {miss})", file=out)
+
+
+_profiler: Profiler|None = None   # 当前生效的 `Profiler`
+_NO_STAGE = contextlib.nullcontext()
+
+def _stage(name: str, detail: str=None):
+    """未开启统计时什么都不做。"""
+    return _NO_STAGE if _profiler is None else _profiler.stage(name, detail)
+
+def _count(key: str, n: int=1) -> None:
+    if _profiler is not None:
+        _profiler.counts[key] += n
+
+def _profiled(name: str):
+    """装饰器，把整个函数记为一个阶段。"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            with _profiler.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _profile_from_env() -> None:
+    """根据环境变量 `TOOL_PROFILE` 开启统计，见 `Profiler`。"""
+    target = os.environ.get("TOOL_PROFILE")
+    if not target:
+        return
+    import atexit
+    cprofile_stage = os.environ.get("TOOL_PROFILE_CPROFILE") or None
+    profiler = Profiler(cprofile=cprofile_stage).__enter__()
+    def report():
+        if target.endswith(".json"):
+            profiler.write_json(target)
+        else:
+            profiler.print_summary(sys.stderr)
+        if profiler.cprofile is not None:
+            profiler.dump_cprofile(f"{cprofile_stage}.prof")
+    atexit.register(report)
+
 class LineInfo:
 
     BOOK = 1            # '# '
@@ -18,57 +225,36 @@ class LineInfo:
     FOOTNOTE = 8        # '[^'
     OTHER = 9           
 
+    __slots__ = ('type', 'prefix', 'content', 'offset', 'suffix')
+
+    # 每个分组对应一种类型，分组序号即类型值；"> **_" 须在 "> " 之前
+    _re_kind = re.compile(r"(# )|(## )|(·)|(\*\*_)|(> \*\*_)|(> )|(------)|(\[\^.*?\]: )")
+
     def __init__(self, line: str) -> None:
         """获取一行的类型等信息，请确保 `line` 不以换行符结尾。"""
-        self.suffix = ""
-        if line.startswith("# "):
-            self.type = LineInfo.BOOK
-            self.prefix = "# "
-            self.content = line[2:]
-            self.offset = 2
-        elif line.startswith("## "):
-            self.type = LineInfo.CHAPTER
-            self.prefix = "## "
-            self.content = line[3:]
-            self.offset = 3
-        elif line.startswith("·"):
-            self.type = LineInfo.VERSE
-            self.prefix = "·"
-            self.content = line[1:]
-            self.offset = 1
-        elif line.startswith("**_"):
-            self.type = LineInfo.PREV
-            self.prefix = "**_"
-            self.content = line[3:].removesuffix("_**")
-            self.offset = 3
-            self.suffix = "_**"
-        elif line.startswith("> **_"):
-            self.type = LineInfo.TRANS_PREV
-            self.prefix = "> **_"
-            self.content = line[5:].removesuffix("_**")
-            self.offset = 5
-            self.suffix = "_**"
-        elif line.startswith("> "):
-            self.type = LineInfo.TRANS
-            self.prefix = "> "
-            self.content = line[2:]
-            self.offset = 2
-        elif line.startswith("------"):
-            self.type = LineInfo.FOOTNOTE_SIGN
-            self.prefix = ""
-            self.content = "------"
-            self.offset = 0
-        elif line.startswith("[^") and (r := line.find("]: ")) != -1:
-            self.type = LineInfo.FOOTNOTE
-            self.prefix = line[0:r+3]
-            self.content = line[r+3:]
-            self.offset = r + 3
-        else:
+        match = LineInfo._re_kind.match(line)
+        if match is None:
             self.type = LineInfo.OTHER
             self.prefix = ""
             self.content = line
+            self.offset = 0
             self.suffix = ""
+            return
+        type = self.type = match.lastindex
+        if type == LineInfo.FOOTNOTE_SIGN:
+            self.prefix = ""
+            self.content = "------"
             self.offset = 0
+            self.suffix = ""
+            return
+        offset = self.offset = match.end()
+        self.prefix = match.group()
+        if type == LineInfo.PREV or type == LineInfo.TRANS_PREV:
+            self.content = line[offset:].removesuffix("_**")
+            self.suffix = "_**"
+        else:
+            self.content = line[offset:]
+            self.suffix = ""
 
     def get_trans_prefix_and_suffix(self) -> tuple:
         """获取对应译文的标头和标尾"""
@@ -82,40 +268,232 @@ class LineInfo:
             return (self.prefix, self.suffix)
 
 
-class Books(list[dict]):
+LineInfo.BLANK = LineInfo("")
+
+def iter_lines(path: str):
+    """逐行读取文本，以生成器方式返回 (行号, 原行, `LineInfo`)。
+
+    原行保留换行符，`LineInfo` 根据去除首尾空白后的行生成。空行共用 `LineInfo.BLANK`，请勿修改。
+    """
+    no = 0
+    try:
+        with open(path, encoding="utf-8") as f:
+            for no, line in enumerate(f, 1):
+                if line == "\n":
+                    yield (no, line, LineInfo.BLANK)
+                else:
+                    yield (no, line, LineInfo(line.strip()))
+    finally:
+        if _profiler is not None:
+            _profiler.counts["lines"] += no
+            _profiler.books.setdefault(str(path), {})['lines'] = no
+
+
+class _Record:
+    """`Verse`、`Chapter`、`Book` 的基类。用 `__slots__` 保存属性以节省内存，
+    同时保留 `verse['lat']` 这样的字典式访问，兼容以前的写法。"""
+
+    __slots__ = ()
+    _fields = ()    # 对外的属性，字典式访问、比较和 repr 只看这些
+
+    def __getitem__(self, key: str):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value) -> None:
+        if key not in self._fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._fields
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default) if key in self._fields else default
+
+    def keys(self) -> tuple:
+        return self._fields
+
+    def __eq__(self, other) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, key) == getattr(other, key) for key in self._fields)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        items = ", ".join(f"{key!r}: {getattr(self, key)!r}" for key in self._fields)
+        return f"{type(self).__name__}({{{items}}})"
+
+
+class Verse(_Record):
+    """一个小节（或概述、书名）的原文和译文。"""
+
+    _fields = ('line_no', 'lat', 'han')
+    __slots__ = _fields + ('_tokens',)
+
+    def __init__(self, line_no: int, lat: str, han: str) -> None:
+        self.line_no = line_no
+        self.lat = lat
+        self.han = han
+        self._tokens = None
+
+    def tokens(self) -> "VerseTokens":
+        """本小节的分字、分词结果，首次调用时生成，之后直接返回。
+
+        `lat`、`han` 被改动后会自动重新生成。
+        """
+        tokens = getattr(self, '_tokens', None)    # 旧缓存中的对象可能没有该属性
+        if tokens is None or tokens.lat is not self.lat or tokens.han is not self.han:
+            _count("cache.tokens.miss")
+            tokens = self._tokens = VerseTokens(self.lat, self.han)
+        elif _profiler is not None:
+            _profiler.counts["cache.tokens.hit"] += 1
+        return tokens
+
+    def __getstate__(self):
+        # 分字结果可随时重新生成，不写入缓存文件
+        return (None, {key: getattr(self, key) for key in self._fields})
+
+
+class VerseTokens:
+    """一个小节的分字、分词结果，见 `Verse.tokens()`。
+
+    `lat_zi`、`han_zi`、`lat_ci`、`han_ci` 是字符串元组。罗马字已转为小写，
+    并去掉了 [...] 中的内容。原文和译文字数不符时，`han_ci` 可能不完整。
+    各项在原文本中的位置用 `spans()` 获取，需要时才生成。
+    """
+
+    __slots__ = ('lat', 'han', 'lat_zi', 'han_zi', 'lat_ci', 'han_ci', '_masked', '_spans')
+
+    def __init__(self, lat: str, han: str) -> None:
+        self.lat = lat
+        self.han = han
+        _count("regex.scans", 4)
+        masked = self._masked = VerseTokens._mask_notes(lat.lower())
+        # 音节和汉字重复很多，驻留后各小节共用同一个字符串对象
+        intern = sys.intern
+        self.lat_zi = tuple(map(intern, Books._re_lat_zi.findall(masked)))
+        self.lat_ci = tuple(map(intern, Books._re_lat_ci.findall(masked)))
+        han_zi = self.han_zi = tuple(map(intern, Books._re_han_zi.findall(han)))
+        han_ci = []
+        index = 0
+        for lat_ci in self.lat_ci:
+            zi_count = lat_ci.count('-') + 1
+            han_ci.append(intern("".join(han_zi[index:index+zi_count])))
+            index += zi_count
+        self.han_ci = tuple(han_ci)
+        self._spans = None
+
+    def _mask_notes(lat: str) -> str:
+        """把 [...] 换成等长的空格，下标保持不变，之后对整行扫描一遍即可分字、分词。"""
+        parts = []
+        index = 0
+        for note in Books._re_note.finditer(lat):
+            (start, end) = note.span()
+            parts.append(lat[index:start])
+            parts.append(" " * (end - start))
+            index = end
+        if not parts:
+            return lat
+        parts.append(lat[index:])
+        return "".join(parts)
+
+    def spans(self) -> tuple[array.array, array.array, array.array, array.array|None]:
+        """返回 (lat_zi_spans, han_zi_spans, lat_ci_spans, han_ci_spans)。
+
+        每一项都是把各分字或分词的 (start, end) 依次展开的整数数组，下标相对于 `lat` 或 `han`。
+        原文和译文字数不符时，`han_ci_spans` 为 `None`。
+        """
+        if self._spans is None:
+            _count("regex.scans", 3)
+            lat_zi_spans = VerseTokens._scan_spans(Books._re_lat_zi, self._masked)
+            han_zi_spans = VerseTokens._scan_spans(Books._re_han_zi, self.han)
+            lat_ci_spans = VerseTokens._scan_spans(Books._re_lat_ci, self._masked)
+            han_ci_spans = None
+            if len(self.lat_zi) == len(self.han_zi):
+                han_ci_spans = array.array('I')
+                index = 0
+                for lat_ci in self.lat_ci:
+                    zi_count = lat_ci.count('-') + 1
+                    han_ci_spans.append(han_zi_spans[2*index])
+                    han_ci_spans.append(han_zi_spans[2*(index+zi_count)-1])
+                    index += zi_count
+            self._spans = (lat_zi_spans, han_zi_spans, lat_ci_spans, han_ci_spans)
+        return self._spans
+
+    def _scan_spans(pattern: re.Pattern, text: str) -> array.array:
+        spans = array.array('I')
+        for match in pattern.finditer(text):
+            spans.extend(match.span())
+        return spans
+
+
+class Chapter(_Record):
+    """一章。`verses[0]` 通常是概述小节。"""
+
+    __slots__ = _fields = ('line_no', 'title', 'verses')
+
+    def __init__(self, line_no: int, title: str, verses: list[Verse]=None) -> None:
+        self.line_no = line_no
+        self.title = title
+        self.verses = verses if verses is not None else []
+
+
+class Book(_Record):
+    """一本书。`book_name` 的结构和小节相同。
+
+    `path` 只是来源文件的路径，不算内容：不能字典式访问，也不参与比较和 repr。"""
+
+    _fields = ('book_name', 'chapters', 'footnotes')
+    __slots__ = ('path',) + _fields
+
+    def __init__(self, path: str=None, book_name: Verse=None,
+                 chapters: list[Chapter]=None, footnotes: list[str]=None) -> None:
+        self.path = path
+        self.book_name = book_name if book_name is not None else Verse(None, None, None)
+        self.chapters = chapters if chapters is not None else []
+        self.footnotes = footnotes if footnotes is not None else []
+
+
+class Books(list[Book]):
     """books 列表。其格式如下:
     ```
-    [book{}, book{}...],
+    [Book, Book...],
     ```
     ---
-    其中 `book{}` 格式如下：
+    其中 `Book` 格式如下（也可以用 `book['chapters']` 这样的字典方式访问）：
     ```
-    { 'book_name': {'line_no': 行号, 'lat': 原文, 'han': 译文},
-      'chapters':  [chapter{}, chapter{}...],
-      'footnotes': ['xx', 'xx'...] }
+    Book( book_name: Verse(line_no=行号, lat=原文, han=译文),
+          chapters:  [Chapter, Chapter...],
+          footnotes: ['xx', 'xx'...] )
     ```
+    另有属性 `book.path`: 文件路径。
     ---
-     其中的 `chapter{}` 格式如下：
+     其中的 `Chapter` 格式如下：
     ```
-    { 'line_no': 行号,
-      'title':   标题(如'Mt. 4.'),
-      'verses':  [verse{}, verse{}...] }
+    Chapter( line_no: 行号,
+             title:   标题(如'Mt. 4.'),
+             verses:  [Verse, Verse...] )
     ```
     ---
-    其中的 `verse{}` 格式如下：
+    其中的 `Verse` 格式如下：
     ```
-    { 'line_no': 行号, 'lat': 原文, 'han': 译文 }
+    Verse( line_no: 行号, lat: 原文, han: 译文 )
     ```
     """
 
-    # 目前只能查 分词。无法查分字或分词组成的词。
-    def find_ci_pair(self, lat_ci: str, han_ci: str) -> None:
+    # 只能查分词。查分字或跨分词的字串请用 `find_zi_pair()`。
+    def find_ci_pair(self, lat_ci: str, han_ci: str) -> list["CiPosting"]|None:
         """
         在 books 中查找 相互对应 的 lat_ci 和 han_ci，输出找到的内容。
+
+        返回找到的 `CiPosting` 列表，输入有误则返回 `None`。
         """
         # 检验输入
         lat_ci = lat_ci.lower()
-        (q_list_lat, q_list_han) = Books._verse_fenzi({'lat':lat_ci, 'han':han_ci})
+        (q_list_lat, q_list_han) = Books._verse_fenzi(Verse(None, lat_ci, han_ci))
         if len(q_list_lat) == 0 or len(q_list_han) == 0:
             print("🔴 请输入正确的内容！")
             return 
@@ -124,85 +502,285 @@ class Books(list[dict]):
                   f"lat: {len(q_list_lat)}, han: {len(q_list_han)}")
             return
         # 查找
-        for book in self:
-            for chap_index,chapter in enumerate(book['chapters']):
-                for verse_no,verse in enumerate(chapter['verses']):
-                    details = Books._verse_fenci_with_details(verse)
-                    # verse: [{'lat':xx, 'lat_span':xx, 'han':xx, 'han_span':xxx}, ...]
-                    select = []
-                    for ci_info in details:
-                        if ci_info['lat'] == lat_ci and ci_info['han'] == han_ci:
-                            select.append(ci_info)
-                    show_lat = verse['lat']
-                    show_han = verse['han']
-                    if len(select)>0:
-                        print(f"🟢 在《{book['book_name']['han']}》, 第 {chap_index+1} 章, 第 {verse_no} 节: (第 {verse['line_no']} 行)")
-                    else:
-                        continue
-                    select.reverse()    # 从右往左替换，这样左边的下标不变
-                    for ci_info in select:
-                        lat_span = ci_info['lat_span']
-                        han_span = ci_info['han_span']
-                        show_lat = show_lat[0:lat_span[0]] + "👉🏻" + show_lat[lat_span[0]:lat_span[1]] + "👈🏻" + show_lat[lat_span[1]:]
-                        show_han = show_han[0:han_span[0]] + "👉" + show_han[han_span[0]:han_span[1]] + "👈" + show_han[han_span[1]:]
-                    print(f"lat: " + show_lat)
-                    print(f"han: " + show_han)
-
-    def fenci(self, zi:bool=False) -> Counter|None:
+        postings = self.search_ci(lat_ci, han_ci)
+        if not postings:
+            self._print_suggestions(lat_ci)
+        self._print_postings(postings)
+        return postings
+
+    def find_zi_pair(self, lat: str, han: str) -> list["CiPosting"]|None:
+        """
+        在 books 中查找 相互对应 的连续分字，如 `find_zi_pair("kao ts'ing", "告清")`，
+        可以是词的一部分，也可以跨越多个分词，输出找到的内容。
+
+        返回找到的 `CiPosting` 列表，输入有误则返回 `None`。
+        """
+        (q_list_lat, q_list_han) = Books._verse_fenzi(Verse(None, lat, han))
+        if len(q_list_lat) == 0 or len(q_list_han) == 0:
+            print("🔴 请输入正确的内容！")
+            return
+        if len(q_list_lat) != len(q_list_han):
+            print(f"🔴 输入内容的分字数量不相符！"
+                  f"lat: {len(q_list_lat)}, han: {len(q_list_han)}")
+            return
+        postings = self.search_zi(lat, han)
+        if not postings:
+            self._print_suggestions(lat)
+        self._print_postings(postings)
+        return postings
+
+    def _print_suggestions(self, lat: str) -> None:
+        """没有找到时，列出相近的罗马字写法及其常见译法。"""
+        matches = [m for m in self.search_fuzzy(lat, limit=5) if m.term != fold_lat(lat, diacritics=True)]
+        if not matches:
+            return
+        print("🟡 没有找到，相近的写法有：")
+        for m in matches:
+            translations = self.ci_index.translations(m.term).most_common(3)
+            shown = "、".join(han for (han, _) in translations)
+            print(f"    {m.term} ({m.count} 次){'：' + shown if shown else ''}")
+
+    def _print_postings(self, postings: list["CiPosting"]) -> None:
+        """输出查找结果，同一小节的结果放在一起，并标出位置。"""
+        i = 0
+        while i < len(postings):
+            p = postings[i]
+            j = i
+            while j < len(postings) and postings[j][:3] == p[:3]:
+                j += 1
+            verse = self[p.book_no-1].chapters[p.chapter_no-1].verses[p.verse_no]
+            print(f"🟢 在《{self[p.book_no-1].book_name.han}》, 第 {p.chapter_no} 章, 第 {p.verse_no} 节: (第 {verse.line_no} 行)")
+            show_lat = verse.lat
+            show_han = verse.han
+            for ci_info in reversed(postings[i:j]):    # 从右往左替换，这样左边的下标不变
+                lat_span = ci_info.lat_span
+                han_span = ci_info.han_span
+                show_lat = show_lat[0:lat_span[0]] + "👉🏻" + show_lat[lat_span[0]:lat_span[1]] + "👈🏻" + show_lat[lat_span[1]:]
+                show_han = show_han[0:han_span[0]] + "👉" + show_han[han_span[0]:han_span[1]] + "👈" + show_han[han_span[1]:]
+            print(f"lat: " + show_lat)
+            print(f"han: " + show_han)
+            i = j
+
+    def search_ci(self, lat_ci: str=None, han_ci: str=None) -> list["CiPosting"]:
+        """通过分词索引查找，不输出内容。可只给出 `lat_ci` 或 `han_ci` 中的一个。
+
+        返回 `CiPosting` 列表，按书卷、章、节的顺序排列。
+        """
+        index = self.ci_index
+        if lat_ci is not None:
+            lat_ci = lat_ci.lower()
+        if lat_ci is not None and han_ci is not None:
+            return list(index.by_pair.get((lat_ci, han_ci), ()))
+        elif lat_ci is not None:
+            return list(index.by_lat.get(lat_ci, ()))
+        elif han_ci is not None:
+            return list(index.by_han.get(han_ci, ()))
+        else:
+            raise TypeError("lat_ci 和 han_ci 至少需要给出一个。")
+
+    @property
+    def ci_index(self) -> "CiIndex":
+        """分词倒排索引。第一次使用时构建，之后重复使用。
+        修改了 books 的内容后，请调用 `rebuild_ci_index()`。
+        """
+        index = getattr(self, "_ci_index", None)
+        if index is None:
+            index = self.rebuild_ci_index()
+        return index
+
+    def rebuild_ci_index(self) -> "CiIndex":
+        """重新构建分词倒排索引。"""
+        self._ci_index = CiIndex(self)
+        return self._ci_index
+
+    def search_zi(self, lat: str=None, han: str=None) -> list["CiPosting"]:
+        """通过分字索引查找连续的分字串，不输出内容。可只给出 `lat` 或 `han` 中的一个。
+
+        `lat` 中的音节可用空格或连字符分隔，如 "kao ts'ing" 或 "kao-ts'ing"，
+        查找时不区分分词边界。
+
+        返回 `CiPosting` 列表，按书卷、章、节的顺序排列。
+        """
+        return self.zi_index.search(lat, han)
+
+    @property
+    def zi_index(self) -> "ZiIndex":
+        """分字索引。第一次使用时构建，之后重复使用。
+        修改了 books 的内容后，请调用 `rebuild_zi_index()`。
+        """
+        index = getattr(self, "_zi_index", None)
+        if index is None:
+            index = self.rebuild_zi_index()
+        return index
+
+    def rebuild_zi_index(self) -> "ZiIndex":
+        """重新构建分字索引。"""
+        self._zi_index = ZiIndex(self)
+        return self._zi_index
+
+    def search_fuzzy(self, query: str, max_distance: int=2, limit: int=10) -> list["FuzzyMatch"]:
+        """模糊查找罗马字的音节或分词，可以省略附加符号和撇号，也容许输错几个字母。
+
+        如 `search_fuzzy("zong ti")` 能找到 "zông-ti"。返回 `FuzzyMatch` 列表，
+        用其中的 `term` 再调用 `search_ci()` 等即可查到具体位置。
+        """
+        return self.fuzzy_index.search(query, max_distance, limit)
+
+    @property
+    def fuzzy_index(self) -> "FuzzyIndex":
+        """罗马字模糊查找索引。第一次使用时构建，之后重复使用。
+        修改了 books 的内容后，请调用 `rebuild_fuzzy_index()`。
+        """
+        index = getattr(self, "_fuzzy_index", None)
+        if index is None:
+            index = self.rebuild_fuzzy_index()
+        return index
+
+    def rebuild_fuzzy_index(self) -> "FuzzyIndex":
+        """重新构建罗马字模糊查找索引。"""
+        self._fuzzy_index = FuzzyIndex(self)
+        return self._fuzzy_index
+
+    @_profiled("update_book")
+    def update_book(self, book_no: int, book: Book=None) -> None:
+        """替换第 `book_no` 本书（从 1 开始），并只更新这本书在各索引中的记录。
+
+        直接修改了某本书的内容后，也可以不给 `book`，只用来更新索引。
+        分词统计会根据内容自动判断是否需要重新统计，无需另外处理。
+        """
+        if book is not None:
+            self[book_no-1] = book
+        else:
+            book = self[book_no-1]
+        if getattr(self, "_ci_index", None) is not None:
+            self._ci_index.update_book(book_no, book)
+        if getattr(self, "_zi_index", None) is not None:
+            self._zi_index.update_book(book_no, book)
+        if getattr(self, "_fuzzy_index", None) is not None:
+            self._fuzzy_index.update_book(book_no, book)
+
+    def fenci(self, zi:bool=False, mismatches:list=None) -> Counter|None:
         """对 books 里的 书名 和 verses 进行分词或分字统计。
 
         参数: 
             `zi`: 是否分字，默认为分词。
+            `mismatches`: 可选的列表。默认遇到原文和译文字数不符时中止并返回 `None`；
+                给出列表时不中止，而是把所有字数不符的地方以 `Mismatch` 记录加进该列表，
+                并跳过这些小节继续统计。
+
+        每本书的统计结果会缓存起来，再次调用时只重新统计内容改动过的书。
         
         返回: `Counter`。 {(lat, han): count}
         """
-        counter = Counter()
+        with _stage("fenzi" if zi else "fenci"):
+            return self._fenci(zi, mismatches)
 
-        for book in self:
-            # 处理书名
-            book_name = {
-                    'lat': book['book_name']['lat'], 
-                    'han':book['book_name']['han']
-            }
-            (list_lat_zi, list_han_zi) = Books._verse_fenzi(book_name)
-            if len(list_han_zi) != len(list_lat_zi):
-                print(f"🔴 {book['book_name']['han']}: 书名翻译字数与原文不符：")
-                return None
-            if zi:
-                counter.update(list(zip(list_lat_zi, list_han_zi)))
-            else:
-                (list_lat_ci, list_han_ci) = Books._verse_fenci(book_name, list_han_zi)
-                counter.update(list(zip(list_lat_ci, list_han_ci)))
-
-            # 处理小节
-            for chapter in book['chapters']:
-                for verse in chapter['verses']:
-                    # 先判断原文和译文的字数是否统一
-                    (list_lat_zi, list_han_zi) = Books._verse_fenzi(verse)
-                    if len(list_han_zi) != len(list_lat_zi):
-                        print(f"🔴 {book['book_name']['han']}-第 {verse['line_no']} 行: "
-                              "翻译字数与原文不符：")
-                        print(f"    lat: {verse['lat']}")
-                        print(f"    han: {verse['han']}\n函数中止！请修正！")
-                        return None
-                    if zi:
-                        counter.update(list(zip(list_lat_zi, list_han_zi)))
+    def _fenci(self, zi:bool, mismatches:list|None) -> Counter|None:
+        counter = Counter()
+        for book_no, book in enumerate(self, 1):
+            (book_counter, book_mismatches) = self._book_fenci(book, zi)
+            if book_mismatches:
+                if mismatches is None:
+                    first = book_mismatches[0]
+                    if first.verse_no is None:
+                        print(f"🔴 {book.book_name.han}: 书名翻译字数与原文不符：")
                     else:
-                        (list_lat_ci, list_han_ci) = Books._verse_fenci(verse, list_han_zi)
-                        counter.update(list(zip(list_lat_ci, list_han_ci)))
+                        print(f"🔴 {book.book_name.han}-第 {first.line_no} 行: "
+                              "翻译字数与原文不符：")
+                        print(f"    lat: {first.lat}")
+                        print(f"    han: {first.han}\n函数中止！请修正！")
+                    return None
+                mismatches.extend(m._replace(book_no=book_no) for m in book_mismatches)
+            counter.update(book_counter)
         return counter
 
-    def get_verse(self, book_no:int|str, chapter_no:int, verse_no:int):
-        """获取一个小节。*_no 都从 1 开始，但 verse_no 可设为 0 来获取概述小节。"""
-        if type(book_no) == int or (type(book_no)==str and book_no.isdigit()):
-            book_no = int(book_no)
-        elif type(book_no) == str:
-            book_no = book_names.find_book_no(book_no)
-            if book_no == None:
-                print("输入内容有误！")
-                return None
+    def find_mismatches(self, show:bool=True) -> list["Mismatch"]:
+        """一次找出所有原文和译文字数不符的地方。
+
+        参数 `show`: 是否输出找到的内容。
+
+        返回 `Mismatch` 列表。
+        """
+        mismatches = []
+        self.fenci(zi=True, mismatches=mismatches)
+        if show:
+            for m in mismatches:
+                if m.verse_no is None:
+                    print(f"🔴 {m.book}-第 {m.line_no} 行: 书名翻译字数与原文不符："
+                          f"lat: {m.lat_count}, han: {m.han_count}")
+                else:
+                    print(f"🔴 {m.book}-第 {m.line_no} 行 (第 {m.chapter_no} 章, 第 {m.verse_no} 节): "
+                          f"翻译字数与原文不符：lat: {m.lat_count}, han: {m.han_count}")
+                print(f"    lat: {m.lat}")
+                print(f"    han: {m.han}")
+            if len(mismatches) == 0:
+                print("🟢 未发现字数不符。")
+        return mismatches
+
+    def _book_fenci(self, book:Book, zi:bool) -> tuple[Counter, list["Mismatch"]]:
+        """统计一本书，返回 (counter, mismatches)，字数不符的小节不计入 counter。
+
+        结果按书的内容缓存，内容未变时直接返回缓存（请勿修改返回的 counter）。
+        """
+        fingerprint = Books._book_fingerprint(book)
+        cache = self.__dict__.setdefault("_fenci_cache", {})
+        key = (id(book), zi)
+        if key in cache and cache[key][0] == fingerprint:
+            _count("cache.fenci.hit")
+            return cache[key][1]
+        _count("cache.fenci.miss")
+        with _stage("fenzi" if zi else "fenci", book.path):
+            result = self._count_book(book, zi)
+        cache[key] = (fingerprint, result)
+        return result
+
+    def _count_book(self, book:Book, zi:bool) -> tuple[Counter, list["Mismatch"]]:
+        """`_book_fenci()` 的实际统计部分，不使用缓存。"""
+
+        counter = Counter()
+        mismatches = []
+        # 处理书名
+        book_name = book.book_name
+        (list_lat_zi, list_han_zi) = Books._verse_fenzi(book_name)
+        if len(list_han_zi) != len(list_lat_zi):
+            mismatches.append(Mismatch(None, book_name.han, None, None,
+                                       book_name.line_no, book_name.lat, book_name.han,
+                                       len(list_lat_zi), len(list_han_zi)))
+        elif zi:
+            counter.update(list(zip(list_lat_zi, list_han_zi)))
         else:
-            raise TypeError("book_no 参数只支持 整数编号 或 书名。")
+            (list_lat_ci, list_han_ci) = Books._verse_fenci(book_name, list_han_zi)
+            counter.update(list(zip(list_lat_ci, list_han_ci)))
+
+        # 处理小节
+        for chapter_no, chapter in enumerate(book.chapters, 1):
+            for verse_no, verse in enumerate(chapter.verses):
+                # 先判断原文和译文的字数是否统一
+                (list_lat_zi, list_han_zi) = Books._verse_fenzi(verse)
+                if len(list_han_zi) != len(list_lat_zi):
+                    mismatches.append(Mismatch(None, book_name.han, chapter_no, verse_no,
+                                               verse.line_no, verse.lat, verse.han,
+                                               len(list_lat_zi), len(list_han_zi)))
+                    continue
+                if zi:
+                    counter.update(list(zip(list_lat_zi, list_han_zi)))
+                else:
+                    (list_lat_ci, list_han_ci) = Books._verse_fenci(verse, list_han_zi)
+                    counter.update(list(zip(list_lat_ci, list_han_ci)))
+        return (counter, mismatches)
+
+    def _book_fingerprint(book:Book) -> int:
+        """根据书名和各小节的文本计算指纹，用于判断书的内容是否改动。"""
+        return hash((book.book_name.lat, book.book_name.han,
+                     tuple((verse.lat, verse.han)
+                           for chapter in book.chapters for verse in chapter.verses)))
+
+    def get_verse(self, book_no:int|str, chapter_no:int, verse_no:int) -> Verse|None:
+        """获取一个小节。*_no 都从 1 开始，但 verse_no 可设为 0 来获取概述小节。"""
+        book_no = Books._book_no(book_no)
+        if book_no == None:
+            print("输入内容有误！")
+            return None
         book_index = book_no - 1
         chapter_index = chapter_no - 1
         verse_index = verse_no  # 0 表示概述小节
@@ -210,19 +788,60 @@ class Books(list[dict]):
             print("未找到该小节！")
             return None
         if book_index>=len(self) \
-            or chapter_index>=len(self[book_index]['chapters'])\
-                or verse_index>=len(self[book_index]['chapters'][chapter_index]['verses']):
+            or chapter_index>=len(self[book_index].chapters)\
+                or verse_index>=len(self[book_index].chapters[chapter_index].verses):
             print("未找到该小节！")
             return None
-        verse = self[book_index]['chapters'][chapter_index]['verses'][verse_index]
+        verse = self[book_index].chapters[chapter_index].verses[verse_index]
         return verse
 
+    def _book_no(book_no: int|str) -> int|None:
+        """把书的编号或书名统一为编号，书名找不到时返回 `None`。"""
+        if type(book_no) == int or (type(book_no)==str and book_no.isdigit()):
+            return int(book_no)
+        elif type(book_no) == str:
+            return book_names.find_book_no(book_no)
+        else:
+            raise TypeError("book_no 参数只支持 整数编号 或 书名。")
+
+    def get_verses(self, refs: "str|list[Reference]") -> list[tuple["Reference", list[Verse]]]:
+        """批量获取经文引用对应的小节，如 `books.get_verses("Mk. 1.2-8; 太 5:3")`。
+
+        `refs` 可以是引用字符串（格式见 `parse_refs()`），也可以是 `Reference` 列表。
+        返回 [(Reference, [Verse, ...]), ...]，整章引用不含概述小节；
+        超出范围的部分会输出提示，其对应的列表可能为空或不完整。
+        """
+        if isinstance(refs, str):
+            refs = parse_refs(refs)
+        results = []
+        for ref in refs:
+            if ref.book_no > len(self):
+                print(f"🔴 未载入第 {ref.book_no} 本书: {ref.text}")
+                results.append((ref, []))
+                continue
+            chapters = self[ref.book_no-1].chapters
+            verses = []
+            for chapter_no in range(ref.chapter_no, ref.end_chapter_no + 1):
+                if not 1 <= chapter_no <= len(chapters):
+                    print(f"🔴 未找到第 {chapter_no} 章: {ref.text}")
+                    break
+                chapter_verses = chapters[chapter_no-1].verses
+                # 小节的下标就是节号，0 是概述小节
+                start = ref.verse_no if ref.verse_no is not None and chapter_no == ref.chapter_no else 1
+                end = ref.end_verse_no if ref.end_verse_no is not None and chapter_no == ref.end_chapter_no \
+                      else len(chapter_verses) - 1
+                if start >= len(chapter_verses) or end >= len(chapter_verses):
+                    print(f"🟡 第 {chapter_no} 章只有 {len(chapter_verses) - 1} 节: {ref.text}")
+                verses.extend(chapter_verses[start:end+1])
+            results.append((ref, verses))
+        return results
+
     def forEach_verse(self, oper):
         """对每一节回调 `oper(verse)` 函数。
         """
         for book in self:
-            for chapter in book['chapters']:
-                for verse in chapter['verses']:
+            for chapter in book.chapters:
+                for verse in chapter.verses:
                     oper(verse)
 
 
@@ -233,258 +852,968 @@ class Books(list[dict]):
     _re_han_zi = re.compile(r"\{.+?\}|[\u4E00-\u9FA5❓□㾎𧮙䫲𤖼𠡒𣥼䂸㔶䥛䀹㬹㧒詨]")
     _re_lat_ci = re.compile(r"['a-zA-ZÜüÔôÖöÆæ]['a-zA-ZÜüÔôÖöÆæ-]*")
 
-    def _verse_fenzi(verse:dict)->tuple[list,list]:
+    # 分字、分词的结果缓存在各小节上，见 `Verse.tokens()`
+
+    def _verse_fenzi(verse:Verse)->tuple[tuple,tuple]:
         """对单条 verse 进行分字。
         
-        verse 格式：{'lat':xxx, 'han':xxx}
-        
         返回 (list_lat_zi, list_han_zi)
         """
-        verse_lat = verse['lat'].lower()
-        verse_han = verse['han']
-        verse_lat = Books._re_note.sub("", verse_lat) # 去掉[...]
-        list_lat_zi = Books._re_lat_zi.findall(verse_lat)
-        list_han_zi = Books._re_han_zi.findall(verse_han)
-        return (list_lat_zi, list_han_zi)
-
-    def _verse_fenci(verse:dict, list_han_zi:list=None)->tuple[list,list]:
+        tokens = verse.tokens()
+        return (tokens.lat_zi, tokens.han_zi)
+
+    def _verse_fenci(verse:Verse, list_han_zi:list=None)->tuple[tuple,tuple]:
         """对单条 verse 进行分词。基于 罗马字文本 的连字符。
-        
-        verse 格式：{'lat':xxx, 'han':xxx}
 
-        参数 `list_han_zi`: 可选。表示已分好字的汉字列表。加快速度。
+        参数 `list_han_zi`: 已不再需要，分字结果会缓存在小节上。保留只为兼容。
         
         返回 (list_lat_ci, list_han_ci)
         """
-        verse_lat = verse['lat'].lower()
-        verse_lat = Books._re_note.sub("", verse_lat) # 去掉[...]
-        list_lat_ci = Books._re_lat_ci.findall(verse_lat)
-        if list_han_zi == None:
-            verse_han = verse['han']
-            list_han_zi = Books._re_han_zi.findall(verse_han)
-        list_han_ci = []
-        index = 0
-        for lat_ci in list_lat_ci:
-            zi_count = lat_ci.count('-')+1
-            han_ci = "".join(list_han_zi[index:index+zi_count])
-            list_han_ci.append(han_ci)
-            index += zi_count
-        return (list_lat_ci, list_han_ci)
+        tokens = verse.tokens()
+        return (tokens.lat_ci, tokens.han_ci)
 
-    def _verse_fenci_with_details(verse:dict)->list[dict]:
-        """分词并带有下标细节。
+    def _verse_fenci_with_details(verse:Verse)->list[dict]:
+        """分词并带有下标细节。请确保原文和译文的字数相符。
         返回 [{'lat':xxx, 'han':xxx, 'lat_span':xxx, 'han_span':xxx}, ...]
         """
-        details = []
-        lat = verse['lat'].lower()
-        han = verse['han']
-        # lat = Books._re_note.sub("", lat) # 去掉 [...]
-        lat_ci_with_note_matches = Books._re_lat_ci.finditer(lat)
-        # 去掉 [...]，因为涉及到下标，不能对原文本进行 sub，所以以这方式
-        note_matches = Books._re_note.finditer(lat)
-        note_matches = list(note_matches) # 需要多次遍历，加进列表里
-        if len(note_matches) == 0:
-            lat_ci_matches = lat_ci_with_note_matches
-        else:
-            lat_ci_matches = []
-            for match in lat_ci_with_note_matches:
-                need_added = True
-                for note in note_matches:   # 需要多次遍历，所以上面加进列表里
-                    if match.span()[0] > note.span()[0] and match.span()[1] < note.span()[1]:
-                        need_added = False
-                        break
-                if need_added:
-                    lat_ci_matches.append(match)
-
-        han_zi_matches = Books._re_han_zi.finditer(han)
-        han_zi_matches = list(han_zi_matches)
-        
-        list_han_zi = [match.group() for match in han_zi_matches]
-        index = 0
-        for lat_ci_match in lat_ci_matches:
-            ci = {}
-            ci['lat'] = lat_ci_match.group()
-            ci['lat_span'] = lat_ci_match.span()    
-            zi_count = ci['lat'].count("-")+1
-            han_ci = list_han_zi[index:index+zi_count]
-            span_start = han_zi_matches[index].span()[0]
-            span_end = han_zi_matches[index+zi_count-1].span()[1]
-            ci['han'] = "".join(han_ci)
-            ci['han_span'] = (span_start, span_end)
-            details.append(ci)
-            index += zi_count
+        tokens = verse.tokens()
+        (_, _, lat_spans, han_spans) = tokens.spans()
+        return [{'lat': lat, 'han': han,
+                 'lat_span': (lat_spans[2*i], lat_spans[2*i+1]),
+                 'han_span': (han_spans[2*i], han_spans[2*i+1])}
+                for i, (lat, han) in enumerate(zip(tokens.lat_ci, tokens.han_ci))]
 
-        return details
+class CiPosting(NamedTuple):
+    """分词或分字索引中的一条记录。编号与 `Books.get_verse()` 的参数一致。"""
+    book_no: int            # 从 1 开始
+    chapter_no: int         # 从 1 开始
+    verse_no: int           # 0 表示概述小节
+    lat: str
+    han: str
+    lat_span: tuple[int, int]   # 在 verse.lat 中的下标
+    han_span: tuple[int, int]   # 在 verse.han 中的下标
 
-def validate_origin_punc(origin_path: str):
-    """验证原文文本标点符号格式是否正确。
-    
-    Args:
-        file_path: 原文文本路径。
+
+class Mismatch(NamedTuple):
+    """原文和译文字数不符的记录。书名行的 `chapter_no` 和 `verse_no` 为 `None`。"""
+    book_no: int            # 从 1 开始
+    book: str               # 书名（译文）
+    chapter_no: int|None    # 从 1 开始
+    verse_no: int|None      # 0 表示概述小节
+    line_no: int
+    lat: str
+    han: str
+    lat_count: int
+    han_count: int
+
+
+class CiIndex:
+    """分词倒排索引。遍历一次 books 构建，之后查询只需查表。
+
+    `by_pair`: {(lat, han): [CiPosting, ...]}
+    `by_lat`:  {lat: [CiPosting, ...]}
+    `by_han`:  {han: [CiPosting, ...]}
+
+    原文和译文字数不符的小节不会收录。
+    """
+
+    @_profiled("CiIndex")
+    def __init__(self, books: Books) -> None:
+        self.by_pair = {}
+        self.by_lat = {}
+        self.by_han = {}
+        self._book_postings = {}    # {book_no: [CiPosting, ...]}，用于单独更新某本书
+        for book_no, book in enumerate(books, 1):
+            postings = CiIndex._make_postings(book_no, book)
+            self._book_postings[book_no] = postings
+            for posting in postings:
+                self.by_pair.setdefault((posting.lat, posting.han), []).append(posting)
+                self.by_lat.setdefault(posting.lat, []).append(posting)
+                self.by_han.setdefault(posting.han, []).append(posting)
+
+    def _make_postings(book_no: int, book: Book) -> list[CiPosting]:
+        """生成一本书的全部记录。"""
+        postings = []
+        for chapter_no, chapter in enumerate(book.chapters, 1):
+            for verse_no, verse in enumerate(chapter.verses):
+                tokens = verse.tokens()
+                (_, _, lat_spans, han_spans) = tokens.spans()
+                if han_spans is None:     # 字数不符
+                    continue
+                for i, (lat, han) in enumerate(zip(tokens.lat_ci, tokens.han_ci)):
+                    postings.append(CiPosting(book_no, chapter_no, verse_no, lat, han,
+                                              (lat_spans[2*i], lat_spans[2*i+1]),
+                                              (han_spans[2*i], han_spans[2*i+1])))
+        return postings
+
+    def update_book(self, book_no: int, book: Book) -> None:
+        """只重新生成第 `book_no` 本书的记录，其余书的记录不变。"""
+        old = self._book_postings.get(book_no, [])
+        new = CiIndex._make_postings(book_no, book)
+        self._book_postings[book_no] = new
+        for (table, key) in ((self.by_pair, lambda p: (p.lat, p.han)),
+                             (self.by_lat, lambda p: p.lat),
+                             (self.by_han, lambda p: p.han)):
+            added = {}
+            for posting in new:
+                added.setdefault(key(posting), []).append(posting)
+            for k in {key(posting) for posting in old} | added.keys():
+                postings = table.setdefault(k, [])
+                # 各列表按书卷顺序排列，这本书的记录是连续的一段，整段替换
+                lo = bisect.bisect_left(postings, book_no, key=lambda p: p.book_no)
+                hi = bisect.bisect_right(postings, book_no, lo=lo, key=lambda p: p.book_no)
+                postings[lo:hi] = added.get(k, [])
+                if not postings:
+                    del table[k]
+
+    def translations(self, lat_ci: str) -> Counter:
+        """某罗马字词的全部汉字写法。 {han: count}"""
+        return Counter(p.han for p in self.by_lat.get(lat_ci.lower(), ()))
+
+    def readings(self, han_ci: str) -> Counter:
+        """某汉字词的全部罗马字写法。 {lat: count}"""
+        return Counter(p.lat for p in self.by_han.get(han_ci, ()))
+
+
+class ZiIndex:
+    """分字索引。把每一小节的 罗马字音节 和 汉字 一一对应成序列，
+    记录每个分字在哪些小节的哪个位置出现，用于查找任意连续的分字串。
+
+    `by_pair`: {(lat_zi, han_zi): [entry, ...]}
+    `by_lat`:  {lat_zi: [entry, ...]}
+    `by_han`:  {han_zi: [entry, ...]}
+
+    为节省内存，`entry` 是把 (verse_id, pos) 合成的一个整数，见 `_entry()`。
+
+    查找时先取查询串中出现最少的分字，再逐个核对其前后的分字，无需遍历全部文本。
+    原文和译文字数不符的小节不会收录。
     """
-    with open(origin_path, encoding="utf-8") as f:
-        no = 0
-        for line in f:
-            no += 1
-            if line == "\n":
+
+    @_profiled("ZiIndex")
+    def __init__(self, books: Books) -> None:
+        # [(book_no, chapter_no, verse_no, lat_zi, han_zi, lat_spans, han_spans), ...]
+        # *_spans 是把各分字的 (start, end) 依次展开的整数数组
+        # 更新某本书后，其旧小节的位置设为 None
+        self.verses = []
+        self.by_pair = {}
+        self.by_lat = {}
+        self.by_han = {}
+        self._book_verses = {}  # {book_no: [verse_id, ...]}，用于单独更新某本书
+        for book_no, book in enumerate(books, 1):
+            self._add_book(book_no, book)
+
+    def _add_book(self, book_no: int, book: Book) -> None:
+        verse_ids = self._book_verses.setdefault(book_no, [])
+        for chapter_no, chapter in enumerate(book.chapters, 1):
+            for verse_no, verse in enumerate(chapter.verses):
+                tokens = verse.tokens()
+                (lat_zi, han_zi) = (tokens.lat_zi, tokens.han_zi)
+                if len(lat_zi) != len(han_zi):
+                    continue
+                verse_id = len(self.verses)
+                verse_ids.append(verse_id)
+                # 与小节上缓存的分字结果共用同一批对象
+                (lat_spans, han_spans, _, _) = tokens.spans()
+                self.verses.append((book_no, chapter_no, verse_no, lat_zi, han_zi,
+                                    lat_spans, han_spans))
+                for pos, (lat, han) in enumerate(zip(lat_zi, han_zi)):
+                    entry = ZiIndex._entry(verse_id, pos)
+                    self.by_pair.setdefault((lat, han), []).append(entry)
+                    self.by_lat.setdefault(lat, []).append(entry)
+                    self.by_han.setdefault(han, []).append(entry)
+
+    def update_book(self, book_no: int, book: Book) -> None:
+        """只重新生成第 `book_no` 本书的记录，其余书的记录不变。"""
+        old_ids = self._book_verses.pop(book_no, [])
+        if old_ids:
+            # 一本书的 verse_id 总是连续的一段，新加的 verse_id 总比已有的大，
+            # 所以各列表中的 entry 从小到大排列，可以用二分查找整段删除
+            lo = ZiIndex._entry(old_ids[0], 0)
+            hi = ZiIndex._entry(old_ids[-1] + 1, 0)
+            keys = set()
+            for verse_id in old_ids:
+                (_, _, _, lat_zi, han_zi, _, _) = self.verses[verse_id]
+                keys.update(zip(lat_zi, han_zi))
+                self.verses[verse_id] = None
+            for (table, table_keys) in ((self.by_pair, keys),
+                                        (self.by_lat, {lat for lat, _ in keys}),
+                                        (self.by_han, {han for _, han in keys})):
+                for k in table_keys:
+                    entries = table[k]
+                    del entries[bisect.bisect_left(entries, lo):bisect.bisect_left(entries, hi)]
+                    if not entries:
+                        del table[k]
+        self._add_book(book_no, book)
+
+    def search(self, lat: str=None, han: str=None) -> list[CiPosting]:
+        """查找连续的分字串。参见 `Books.search_zi()`。"""
+        # 小节上缓存的分字是元组，查询串也转成元组以便逐段比较
+        q_lat = tuple(Books._re_lat_zi.findall(lat.lower())) if lat is not None else None
+        q_han = tuple(Books._re_han_zi.findall(han)) if han is not None else None
+        if q_lat is not None and q_han is not None:
+            if len(q_lat) != len(q_han):
+                return []
+            keys = list(zip(q_lat, q_han))
+            table = self.by_pair
+        elif q_lat is not None:
+            keys = q_lat
+            table = self.by_lat
+        elif q_han is not None:
+            keys = q_han
+            table = self.by_han
+        else:
+            raise TypeError("lat 和 han 至少需要给出一个。")
+        if len(keys) == 0:
+            return []
+        # 以出现次数最少的分字为锚点
+        postings_list = [table.get(key, ()) for key in keys]
+        anchor = min(range(len(keys)), key=lambda k: len(postings_list[k]))
+        size = len(keys)
+        results = []
+        last = (-1, -1)     # 同一小节内不重叠：(verse_id, 上一结果的结束位置)
+        for entry in postings_list[anchor]:
+            verse_id = entry >> ZiIndex._POS_BITS
+            start = (entry & ZiIndex._POS_MASK) - anchor
+            if start < 0 or (verse_id == last[0] and start < last[1]):
                 continue
-            line = line.strip() # 去除换行符
-            line_info = LineInfo(line)
-            type = line_info.type
-            offset = line_info.offset
-            text = line_info.content
-            if type != LineInfo.VERSE and type != LineInfo.PREV:
+            (book_no, chapter_no, verse_no, lat_zi, han_zi, lat_spans, han_spans) = self.verses[verse_id]
+            end = start + size
+            if end > len(lat_zi):
                 continue
-            # 开始处理
-            text = "(" + text + "\n" # 添加头尾方便遍历
-            index = 1
-            while index < len(text)-1: # 遍历行内字符
-                letter = text[index]
-                prev = text[index-1]
-                next = text[index+1]
-                if letter == '[':   # 注解或引用，需持续匹配
-                    ref = False
-                    if next == "^" and prev == " ":
-                        print(f"🟡 行-{no}, 列-{index+offset}: [^...] 注释前不要空格。")
-                    elif next != "^" and prev not in " ‘“(":
-                        print(f"🟡 行-{no}, 列-{index+offset}: [ 前缺少空格。")
-                    if next == "^":
-                        ref = True
-                    while index < len(text)-1: # 持续匹配
-                        index += 1
-                        if index == len(text)-1: # 到达末尾
-                            if text[index] != "]":
-                                print(f"🟡 行-{no}, 列-{index+offset}: 缺少与 [ 匹配的 ]。")
-                            break
-                        if text[index] == "]": # 未到达末尾
-                            if ref: break
-                            if text[index+1] not in "\n )’”":
-                                print(f"🟡 行-{no}, 列-{index+offset}: ] 后缺少空格。")
-                            break
-                elif letter in ",.;:!?":
-                    if next not in "\n ’”)]_":
-                        print(f"🟡 行-{no}, 列-{index+offset}: {letter} 后缺少空格。")
-                elif letter == "‘":
-                    if prev not in " “[(":
-                        print(f"🟡 行-{no}, 列-{index+offset}: ‘ 前缺少空格。")
-                elif letter == '“':
-                    if prev not in " ‘[(":
-                        print(f"🟡 行-{no}, 列-{index+offset}: “ 前缺少空格。")
-                elif letter == "’":
-                    if next not in "\n ,.:;”)]":
-                        print(f"🟡 行-{no}, 列-{index+offset}: ’ 后缺少空格。")
-                elif letter == '”':
-                    if next not in "\n ,.:;’)]":
-                        print(f"🟡 行-{no}, 列-{index+offset}: ” 后缺少空格。")
-                elif letter == "—":
-                    if prev not in " [(‘“":
-                        print(f"🟡 行-{no}, 列-{index+offset}: — 前缺少空格。")
-                    if next == '—':
-                        print(f"🟡 行-{no}, 列-{index+offset}: — 太长了，删掉一半。")
-                        index += 1 # 消耗掉
-                    elif next not in "\n ’”)]":
-                        print(f"🟡 行-{no}, 列-{index+offset}: — 后缺少空格。")
-                index += 1
-
-def generate_trans_file(origin_path: str, trans_path: str=None, fenci:Counter=None):
-    """根据原文文本生成翻译文本模板。
+            if q_lat is not None and lat_zi[start:end] != q_lat:
+                continue
+            if q_han is not None and han_zi[start:end] != q_han:
+                continue
+            last = (verse_id, end)
+            results.append(CiPosting(book_no, chapter_no, verse_no,
+                                     " ".join(lat_zi[start:end]), "".join(han_zi[start:end]),
+                                     (lat_spans[2*start], lat_spans[2*end-1]),
+                                     (han_spans[2*start], han_spans[2*end-1])))
+        # 更新过的书排在后面，这里重新按书卷、章、节排序
+        results.sort(key=lambda p: (p.book_no, p.chapter_no, p.verse_no, p.lat_span))
+        return results
 
-    参数：
-        `from_path`: 原文文本路径
-        `to_path`: 翻译文本路径
-        `fenci`: 可选的分词对象
+    _POS_BITS = 16
+    _POS_MASK = (1 << _POS_BITS) - 1
+
+    def _entry(verse_id: int, pos: int) -> int:
+        """把 (verse_id, pos) 合成一个整数，比元组省内存。"""
+        return (verse_id << ZiIndex._POS_BITS) | pos
+
+
+class FuzzyMatch(NamedTuple):
+    """模糊查找的一条结果，由 `FuzzyIndex.search()` 生成。"""
+    term: str           # 语料中的写法（小写），音节或分词
+    distance: int       # 忽略附加符号和撇号后的编辑距离
+    exact: int          # 不忽略附加符号和撇号时的编辑距离，用于排序
+    count: int          # 在语料中出现的次数
+
+
+# 原文输入时的替代写法，见 原文/編輯説明.md
+_LAT_INPUT_SUBS = (("uy", "ü"), ("ov", "ô"), ("oa", "ö"), ("ae", "æ"))
+_LAT_FOLD_TABLE = str.maketrans({"ü": "u", "ô": "o", "ö": "o", "æ": "a", "'": None})
+_re_lat_apostrophe = re.compile(r"[‘’‛`´ʻʼ]")
+_re_lat_separator = re.compile(r"[\s\-]+")
+
+def fold_lat(text: str, diacritics: bool=False) -> str:
+    """统一罗马字的写法，用于模糊查找。
+
+    转为小写，把 uy/ov/oa/ae 换成 ü/ô/ö/æ，各种撇号换成 `'`，空格和连字符统一为 `-`；
+    `diacritics` 为 `False` 时再去掉附加符号和撇号，如 "K‘ông Ts'ing" -> "kong-tsing"。
     """
-    if origin_path == trans_path:
-        print("🔴 警告: 原文路径不能与目标路径相同！")
-        return
-    if trans_path == None:
-        trans_path = "temp.md"
-    elif pathlib.Path(trans_path).exists():
-        print("🔴 警告: 目标路径已存在，如需重新生成，请先手动删除！\n"
-              f"目标路径: {trans_path}")
-        return
-    with (open(origin_path, "r", encoding="utf-8") as rf,
-          open(trans_path, "w", encoding="utf-8") as wf):
-        for line in rf:
-            wf.write(line)
-            line = line.strip()
-            line_info = LineInfo(line)
-            type = line_info.type
-            if type == LineInfo.BOOK or type == LineInfo.VERSE:
-                wf.write("\n")
-                wf.write(line_info.get_trans_prefix_and_suffix()[0])
-                if fenci != None:
-                    wf.write(lat2han(line_info.content, fenci))
-                wf.write("\n")
-            elif type == LineInfo.CHAPTER:
-                wf.write("\n")
-                wf.write(line_info.get_trans_prefix_and_suffix()[0])
-                wf.write(line_info.content)
-                wf.write("\n")
-            elif type == LineInfo.PREV:
-                wf.write("\n")
-                (prefix, suffix) = line_info.get_trans_prefix_and_suffix()
-                wf.write(prefix)
-                if fenci != None:
-                    wf.write(lat2han(line_info.content, fenci))
-                wf.write(suffix)
-                wf.write("\n")
-        print(f"已完成，请查看 {trans_path}")
+    text = text.strip().lower()
+    for (old, new) in _LAT_INPUT_SUBS:
+        text = text.replace(old, new)
+    text = _re_lat_separator.sub("-", _re_lat_apostrophe.sub("'", text))
+    return text if diacritics else text.translate(_LAT_FOLD_TABLE)
 
-def _load_trans_book(trans_path: str) -> dict:
-    """请使用 `load_trans_books()` 。"""
-    book = {}
-    book['book_name'] = {}
-    book['chapters'] = list[dict]()
-    book['footnotes'] = list[str]()
-    with open(trans_path, 'r', encoding='utf-8') as f:
-        line_no = 0
-        handle_footnotes = False
-        while (line := f.readline()) != '':
-            line_no += 1
-            line_info = LineInfo(line.strip())
-            type = line_info.type
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein 编辑距离。"""
+    if not a or not b:
+        return len(a) + len(b)
+    return _bit_distance(_bit_pattern(a), len(a), b)
 
-            # 检测为书名行
-            if type == LineInfo.BOOK:
-                book['book_name']['line_no'] = line_no
-                book['book_name']['lat'] = line_info.content
-                if f.readline() != '\n':
-                    print(f"🔴 在 {trans_path} 中:")
-                    print(f"    行-{line_no}: 书名行下未空一行，函数中止！")
-                    return None
-                han_line = f.readline()
-                han_line_info = LineInfo(han_line.strip())
-                if han_line_info.type != LineInfo.TRANS:
-                    print(f"🔴 在 {trans_path} 中:")
-                    print(f"    行-{line_no}: 书名行未翻译，函数中止！")
-                    return None
-                line_no += 2
-                book['book_name']['han'] = han_line_info.content
-                if f.readline() != '\n':
-                    print(f"🔴 在 {trans_path} 中:")
-                    print(f"    行-{line_no}: 书名翻译行下未空一行，函数中止！")
-                    return None
-                line_no += 1
+def _bit_pattern(a: str) -> dict[str, int]:
+    """{字符: 该字符在 `a` 中各位置组成的位掩码}，供 `_bit_distance()` 使用。"""
+    pattern = {}
+    for i, c in enumerate(a):
+        pattern[c] = pattern.get(c, 0) | (1 << i)
+    return pattern
 
-            # 检测为章标题行
-            elif type == LineInfo.CHAPTER:
-                book['chapters'].append({})
-                book['chapters'][-1]['line_no'] = line_no
-                book['chapters'][-1]['title'] = line_info.content
-                book['chapters'][-1]['verses'] = list[dict]()
-                if f.readline() != '\n':
-                    print(f"🔴 在 {trans_path} 中:")
-                    print(f"    行-{line_no}: 章标题行下未空一行，函数中止！")
-                    return None
-                han_line = f.readline()
-                han_line_info = LineInfo(han_line.strip())
-                if han_line_info.type != LineInfo.TRANS:
+def _bit_distance(pattern: dict[str, int], m: int, b: str) -> int:
+    """Myers 的位并行算法：一次处理 `a` 的全部位置，每个 `b` 中的字符只需几次整数运算。
+    同一个 `a` 与许多字符串比较时，`pattern` 只需生成一次。"""
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    (pv, mv, score) = (mask, 0, m)
+    for c in b:
+        eq = pattern.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & mask
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv
+    return score
+
+
+class FuzzyIndex:
+    """罗马字的模糊查找索引，收录语料中出现过的全部音节和分词。
+
+    `keys`:     {忽略附加符号后的写法: [语料中的写法, ...]}，见 `fold_lat()`
+    `trigrams`: {(三字母组, key 的长度): [key 编号, ...]}
+    `counts`:   {语料中的写法: 出现次数}
+
+    查找时先用三字母组筛出长度相近、共有的组足够多的候选，再计算编辑距离，
+    不必与全部写法逐一比较。
+    """
+
+    @_profiled("FuzzyIndex")
+    def __init__(self, books: Books) -> None:
+        self.counts = Counter()
+        self.keys = {}
+        self._key_list = []         # [key, ...]，下标即 key 编号
+        self._key_sizes = []        # [key 的三字母组个数, ...]
+        self._by_length = {}        # {key 的长度: [key 编号, ...]}
+        self._short_deletions = {}  # {较短的 key 删去至多两个字母后的写法: [key 编号, ...]}
+        self.trigrams = {}
+        self._book_counts = {}      # {book_no: Counter}，用于单独更新某本书
+        for book_no, book in enumerate(books, 1):
+            self.update_book(book_no, book)
+
+    def _book_terms(book: Book) -> Counter:
+        counter = Counter()
+        for chapter in book.chapters:
+            for verse in chapter.verses:
+                tokens = verse.tokens()
+                counter.update(tokens.lat_zi)
+                counter.update(lat_ci for lat_ci in tokens.lat_ci if "-" in lat_ci)
+        return counter
+
+    def update_book(self, book_no: int, book: Book) -> None:
+        """只重新统计第 `book_no` 本书。不再出现的写法次数为 0，查找时不会返回。"""
+        new = FuzzyIndex._book_terms(book)
+        self.counts.subtract(self._book_counts.get(book_no, Counter()))
+        self.counts.update(new)
+        self._book_counts[book_no] = new
+        for term in new:
+            key = fold_lat(term)
+            terms = self.keys.get(key)
+            if terms is None:
+                terms = self.keys[key] = []
+                key_id = len(self._key_list)
+                self._key_list.append(key)
+                key_trigrams = FuzzyIndex._trigrams(key)
+                self._key_sizes.append(len(key_trigrams))
+                self._by_length.setdefault(len(key), []).append(key_id)
+                if len(key) <= 3 * FuzzyIndex._SHORT_DISTANCE + FuzzyIndex._SHORT_DISTANCE:
+                    for variant in FuzzyIndex._deletions(key, FuzzyIndex._SHORT_DISTANCE):
+                        self._short_deletions.setdefault(variant, []).append(key_id)
+                for trigram in key_trigrams:
+                    self.trigrams.setdefault((trigram, len(key)), []).append(key_id)
+            if term not in terms:
+                terms.append(term)
+
+    # 不超过这个距离时，很短的写法用删除字母的方法查找，见 `search()`
+    _SHORT_DISTANCE = 2
+
+    def _deletions(key: str, count: int) -> set[str]:
+        """`key` 删去至多 `count` 个字母后的全部写法，包括 `key` 本身。"""
+        variants = {key}
+        for _ in range(count):
+            variants |= {variant[:i] + variant[i+1:] for variant in variants for i in range(len(variant))}
+        return variants
+
+    def _trigrams(key: str) -> set[str]:
+        padded = f"^^{key}$"
+        return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+    def search(self, query: str, max_distance: int=2, limit: int=10) -> list[FuzzyMatch]:
+        """查找与 `query` 相近的写法，按距离从小到大、出现次数从多到少排列。
+
+        `query` 可以是音节或分词，音节之间用空格或连字符分隔均可，
+        不区分大小写，可以省略附加符号和撇号，也可以用 uy/ov/oa/ae 输入。
+        """
+        key = fold_lat(query)
+        if not key:
+            return []
+        exact_query = fold_lat(query, diacritics=True)
+        trigrams = FuzzyIndex._trigrams(key)
+        hits = Counter()
+        pattern = _bit_pattern(key)
+        matches = []
+        seen = set()
+        # 距离由小到大逐级查找，够 `limit` 个就不必再找更远的
+        for distance in range(max_distance + 1):
+            if distance == 0:
+                candidates = [key] if key in self.keys else []
+            else:
+                for size in (len(key) - distance, len(key) + distance):
+                    for trigram in trigrams:
+                        hits.update(self.trigrams.get((trigram, size), ()))
+                if distance == 1:
+                    for trigram in trigrams:
+                        hits.update(self.trigrams.get((trigram, len(key)), ()))
+                # 每处编辑最多影响 3 个三字母组，共有的组太少的一定超出距离。
+                # 很短的写法可能一个组也不共有：距离为 d 的两个写法各删去至多 d 个字母后
+                # 一定能变成同一个写法，所以查删除字母后的表；距离更大时逐个比较长度相近的写法
+                (key_list, key_sizes) = (self._key_list, self._key_sizes)
+                key_ids = hits.keys()
+                if len(trigrams) <= 3 * distance:
+                    key_ids = set(key_ids)
+                    if distance <= FuzzyIndex._SHORT_DISTANCE:
+                        for variant in FuzzyIndex._deletions(key, distance):
+                            key_ids.update(self._short_deletions.get(variant, ()))
+                    else:
+                        for length in range(len(key) - distance, len(key) + distance + 1):
+                            key_ids.update(self._by_length.get(length, ()))
+                candidates = [key_list[key_id] for key_id in key_ids
+                              if hits[key_id] >= max(len(trigrams), key_sizes[key_id]) - 3 * distance
+                              and abs(len(key_list[key_id]) - len(key)) <= distance]
+            for candidate in candidates:
+                if candidate in seen or _bit_distance(pattern, len(key), candidate) != distance:
+                    continue
+                seen.add(candidate)
+                for term in self.keys[candidate]:
+                    count = self.counts[term]
+                    if count > 0:
+                        matches.append(FuzzyMatch(term, distance, edit_distance(exact_query, term), count))
+            if len(matches) >= limit:
+                break
+        matches.sort(key=lambda m: (m.distance, m.exact, -m.count, m.term))
+        return matches[:limit]
+
+
+class PuncDiagnostic(NamedTuple):
+    """标点检查的一条结果。`line` 和 `column` 都从 1 开始。"""
+    path: str
+    line: int
+    column: int
+    rule: str       # 规则编号，见 `_PUNC_RULES`
+    message: str
+
+    def format(self) -> str:
+        """输出成以前 `validate_origin_punc()` 的格式。"""
+        return f"🟡 行-{self.line}, 列-{self.column}: {self.message}"
+
+    def to_json(self) -> str:
+        return json.dumps(self._asdict(), ensure_ascii=False)
+
+
+# 标点规则表: (规则编号, 标点, 检查位置, 允许的相邻字符, 提示)
+#   检查位置: "prev" 检查前一个字符；"next" 检查后一个字符；
+#            "double" 检查是否连续重复，重复时消耗掉后一个，并跳过其后的 "next" 规则。
+# [...] 需要成对匹配，单独在 `_check_punc_text()` 中处理。
+_PUNC_RULES = (
+    ("space-after-punc",   ",.;:!?", "next",   "\n ’”)]_", "{punc} 后缺少空格。"),
+    ("space-before-lsquo", "‘",      "prev",   " “[(",      "‘ 前缺少空格。"),
+    ("space-before-ldquo", "“",      "prev",   " ‘[(",      "“ 前缺少空格。"),
+    ("space-after-rsquo",  "’",      "next",   "\n ,.:;”)]", "’ 后缺少空格。"),
+    ("space-after-rdquo",  "”",      "next",   "\n ,.:;’)]", "” 后缺少空格。"),
+    ("space-before-dash",  "—",      "prev",   " [(‘“",     "— 前缺少空格。"),
+    ("dash-too-long",      "—",      "double", "",          "— 太长了，删掉一半。"),
+    ("space-after-dash",   "—",      "next",   "\n ’”)]",   "— 后缺少空格。"),
+)
+
+def _compile_punc_rules(rules) -> dict:
+    """把规则表整理成 {标点: [(规则编号, 检查位置, 允许的字符, 提示), ...]}。"""
+    table = {}
+    for (rule, puncs, side, allowed, message) in rules:
+        for punc in puncs:
+            table.setdefault(punc, []).append((rule, side, frozenset(allowed), message.format(punc=punc)))
+    return table
+
+_PUNC_TABLE = _compile_punc_rules(_PUNC_RULES)
+# 只需停在 [ 和规则表中的标点上，其余字符直接跳过
+_RE_PUNC = re.compile("[" + re.escape("[" + "".join(_PUNC_TABLE)) + "]")
+
+def _check_punc_text(text: str):
+    """检查一段原文（不含行首标记）的标点。
+
+    以生成器方式返回 (列, 规则编号, 提示)，列从 1 开始，相对于 `text`。
+    """
+    text = "(" + text + "\n" # 添加头尾方便遍历
+    end = len(text) - 1
+    table = _PUNC_TABLE
+    search = _RE_PUNC.search
+    match = search(text, 1)
+    while match is not None and match.start() < end:
+        index = match.start()
+        letter = text[index]
+        prev = text[index-1]
+        next = text[index+1]
+        if letter == '[':   # 注解或引用，需持续匹配
+            ref = next == "^"
+            if ref and prev == " ":
+                yield (index, "note-space-before", "[^...] 注释前不要空格。")
+            elif not ref and prev not in " ‘“(":
+                yield (index, "space-before-bracket", "[ 前缺少空格。")
+            close = text.find("]", index+1, end)
+            if close == -1:
+                yield (end, "bracket-unclosed", "缺少与 [ 匹配的 ]。")
+                index = end
+            else:
+                if not ref and text[close+1] not in "\n )’”":
+                    yield (close, "space-after-bracket", "] 后缺少空格。")
+                index = close
+        else:
+            skip_next = False
+            for (rule, side, allowed, message) in table[letter]:
+                if side == "prev":
+                    if prev not in allowed:
+                        yield (index, rule, message)
+                elif side == "double":
+                    if next == letter:
+                        yield (index, rule, message)
+                        skip_next = True
+                elif not skip_next and next not in allowed:
+                    yield (index, rule, message)
+            if skip_next:
+                index += 1  # 消耗掉
+        match = search(text, index+1)
+
+def _check_punc_line(line: str):
+    """检查原文中的一行（不含换行符），只检查小节行和概述行。
+
+    以生成器方式返回 (列, 规则编号, 提示)，列从 1 开始，相对于整行。
+    """
+    return _check_punc_line_info(LineInfo(line))
+
+def _check_punc_line_info(line_info: LineInfo):
+    """同 `_check_punc_line()`，参数为已分类的行。"""
+    if line_info.type != LineInfo.VERSE and line_info.type != LineInfo.PREV:
+        return
+    for (index, rule, message) in _check_punc_text(line_info.content):
+        yield (index + line_info.offset, rule, message)
+
+@_profiled("check_origin_punc")
+def check_origin_punc(*origin_paths: str) -> list[PuncDiagnostic]:
+    """检查一个或多个原文文本的标点符号，不输出内容。
+
+    返回 `PuncDiagnostic` 列表，按文件、行、列的顺序排列。
+    """
+    diagnostics = []
+    for origin_path in origin_paths:
+        with _stage("check_origin_punc", origin_path):
+            for (no, _, line_info) in iter_lines(origin_path):
+                for (column, rule, message) in _check_punc_line_info(line_info):
+                    diagnostics.append(PuncDiagnostic(origin_path, no, column, rule, message))
+    return diagnostics
+
+def validate_origin_punc(origin_path: str) -> list[PuncDiagnostic]:
+    """验证原文文本标点符号格式是否正确，输出找到的问题。
+    
+    Args:
+        file_path: 原文文本路径。
+
+    返回 `PuncDiagnostic` 列表。
+    """
+    diagnostics = check_origin_punc(origin_path)
+    for diagnostic in diagnostics:
+        print(diagnostic.format())
+    return diagnostics
+
+def validate_origin_puncs(*origin_paths: str, workers: int=None) -> list[PuncDiagnostic]:
+    """批量验证多个原文文本的标点符号，按参数顺序输出结果。
+
+    参数 `workers`: 可选的进程数。大于 1 时用多个进程同时验证。
+
+    返回所有文件的 `PuncDiagnostic` 列表。
+    """
+    diagnostics = []
+    for file_diagnostics in _map_books(check_origin_punc, origin_paths, workers):
+        if file_diagnostics:
+            print(f"🟡 在 {file_diagnostics[0].path} 中:")
+        for diagnostic in file_diagnostics:
+            print("    " + diagnostic.format())
+        diagnostics.extend(file_diagnostics)
+    return diagnostics
+
+def write_diagnostics_jsonl(diagnostics, file) -> None:
+    """把检查结果逐条写成 JSON lines。`file` 可以是路径或已打开的文本文件。"""
+    if isinstance(file, (str, pathlib.Path)):
+        with open(file, "w", encoding="utf-8") as f:
+            write_diagnostics_jsonl(diagnostics, f)
+        return
+    for diagnostic in diagnostics:
+        file.write(diagnostic.to_json())
+        file.write("\n")
+
+@_profiled("generate_trans_file")
+def generate_trans_file(origin_path: str, trans_path: str=None, fenci: "Counter|Lat2Han"=None,
+                        merge: bool=False):
+    """根据原文文本生成翻译文本模板。
+
+    参数：
+        `from_path`: 原文文本路径
+        `to_path`: 翻译文本路径
+        `fenci`: 可选的分词对象，或已构建好的 `Lat2Han` 转换器
+        `merge`: 目标文件已存在时，是否与其合并。合并时按 章序号、节号 和原文内容对照，
+            原文未变的行保留已有的译文，只为新增或改动的行生成译文；已有的脚注也会保留，
+            原文没有脚注区时，照抄译文中的整个脚注区。
+    ---
+    结果先写入临时文件，完成后再替换目标文件，中途出错不会留下不完整的译文文件。
+    """
+    if origin_path == trans_path:
+        print("🔴 警告: 原文路径不能与目标路径相同！")
+        return
+    old = None
+    if trans_path == None:
+        trans_path = "temp.md"
+    elif pathlib.Path(trans_path).exists():
+        if not merge:
+            print("🔴 警告: 目标路径已存在，如需重新生成，请先手动删除！\n"
+                  f"目标路径: {trans_path}")
+            return
+        old = _read_trans_lines(trans_path)
+    if isinstance(fenci, Counter):
+        fenci = Lat2Han(fenci)  # 只构建一次，整本书共用
+    kept = added = changed = 0
+    chapter_no = 0
+    used_keys = set()       # 合并时，已保留或已报告改动的原译文位置
+    in_footnotes = False    # 合并时，是否已进入原文的脚注区（`------` 起到文件末尾）
+    extra_footnotes = dict(old['footnotes']) if old is not None else None  # 还没写出的旧脚注
+    replaced = False        # 当前脚注已换成旧脚注，原文中其后的续行不再写出
+    footnote_gap = []       # 脚注区中暂缓写出的空行，旧脚注要写在最后一个脚注之后
+    last_line = "\n"
+    trans_path = pathlib.Path(trans_path)
+    tmp_path = trans_path.with_name(trans_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as wf:
+        for (no, line, line_info) in iter_lines(origin_path):
+            type = line_info.type
+            if old is not None and (in_footnotes or type in (LineInfo.FOOTNOTE_SIGN, LineInfo.FOOTNOTE)):
+                in_footnotes = True
+                if not line.strip():
+                    footnote_gap.append(line)
+                    replaced = False
+                    continue
+                if type == LineInfo.FOOTNOTE:
+                    # 同一标记的脚注以已有译文文件中的为准，连同其续行
+                    footnote = extra_footnotes.pop(line_info.prefix, None)
+                    replaced = footnote is not None
+                    if replaced:
+                        line = "".join(raw + "\n" for raw in footnote)
+                elif type != LineInfo.FOOTNOTE_SIGN and replaced:
+                    continue
+                wf.writelines(footnote_gap)
+                footnote_gap.clear()
+                wf.write(line)
+                if type == LineInfo.FOOTNOTE_SIGN:
+                    # 译文脚注区中第一个脚注之前的其他行
+                    wf.writelines(raw + "\n" for raw in extra_footnotes.pop(None, ()))
+                continue
+            wf.write(line)
+            last_line = line
+            if type == LineInfo.CHAPTER:
+                chapter_no += 1
+            if type in (LineInfo.BOOK, LineInfo.CHAPTER, LineInfo.VERSE, LineInfo.PREV):
+                han_line = None
+                if old is not None:
+                    key = _trans_key(chapter_no, line_info)
+                    stripped = line.strip()
+                    if (key, stripped) in old['by_key']:
+                        han_line = old['by_key'][(key, stripped)]
+                        used_keys.add(key)
+                    elif stripped in old['by_content']:
+                        # 原文未变、只是换了位置
+                        (old_key, han_line) = old['by_content'][stripped]
+                        used_keys.add(old_key)
+                if han_line is not None:
+                    kept += 1
+                else:
+                    han_line = _generate_trans_line(line_info, fenci)
+                    if old is None:
+                        added += 1
+                    elif key in old['keys']:
+                        changed += 1
+                        used_keys.add(key)
+                        print(f"🟡 行-{no}: 原文有改动，已重新生成译文，原译文: {old['keys'][key].strip()}")
+                    elif key[1] is None:
+                        # 找不到节号，无法确定是不是新增的小节，按改动报告
+                        changed += 1
+                        print(f"🟡 行-{no}: 找不到节号，无法与原译文对应，已重新生成译文")
+                    else:
+                        added += 1
+                wf.write("\n")
+                wf.write(han_line)
+                wf.write("\n")
+                last_line = "\n"
+        if old is not None:
+            if in_footnotes:
+                for footnote in extra_footnotes.values():
+                    wf.writelines(raw + "\n" for raw in footnote)
+                wf.writelines(footnote_gap)
+            elif old['footnote_block']:
+                # 原文没有脚注区，照抄译文中的整个脚注区
+                if last_line.strip():
+                    wf.write("\n")
+                wf.writelines(raw + "\n" for raw in old['footnote_block'])
+    os.replace(tmp_path, trans_path)
+    if old is not None:
+        for key in old['keys'].keys() - used_keys:
+            changed += 1
+            print(f"🟡 第 {key[0]} 章 {key[1] or '(无节号)'}: 原文中找不到对应的行，原译文未保留: {old['keys'][key].strip()}")
+        print(f"已完成，保留译文 {kept} 行，新增 {added} 行，改动 {changed} 行，请查看 {trans_path}")
+    else:
+        print(f"已完成，请查看 {trans_path}")
+
+def _generate_trans_line(line_info: LineInfo, fenci: "Lat2Han|None") -> str:
+    """生成原文行对应的译文行（不含换行符）。章标题照抄，其余用 `fenci` 转换。"""
+    (prefix, suffix) = line_info.get_trans_prefix_and_suffix()
+    if line_info.type == LineInfo.CHAPTER:
+        return prefix + line_info.content
+    body = fenci.translate(line_info.content) if fenci != None else ""
+    if line_info.type == LineInfo.PREV:
+        return prefix + body + suffix
+    return prefix + body
+
+_LINE_KINDS = {LineInfo.BOOK: "书名", LineInfo.CHAPTER: "章标题", LineInfo.PREV: "概述"}
+
+def _line_key(line_info: LineInfo) -> str|None:
+    """原文行在一章中的位置：书名/章标题/概述 或 节号，找不到节号时为 `None`。
+
+    合并译文和检查原文改动都用它对应原文行，两者的结果才一致。
+    节号前后的空格可能有误（如 `· 5`），不能因此对应不上。
+    """
+    if line_info.type == LineInfo.VERSE:
+        match = _re_verse_key.match(line_info.content)
+        return match.group(1) if match else None
+    return _LINE_KINDS[line_info.type]
+
+_re_verse_key = re.compile(r"\s*(\d+)")
+
+def _trans_key(chapter_no: int, line_info: LineInfo) -> tuple:
+    """原文行在书中的位置：(章序号, 书名/章标题/概述/节号)。
+    按章序号而不是章标题定位，章标题改动时其下各节仍能对应上。"""
+    return (chapter_no, _line_key(line_info))
+
+def _read_trans_lines(trans_path: str) -> dict:
+    """读取已有的译文文件，找出每个原文行对应的译文行。
+
+    返回 {'by_key': {(位置, 原文行): 译文行}, 'by_content': {原文行: (位置, 译文行)},
+          'keys': {位置: 译文行}, 'footnotes': {脚注标记: [脚注行, 续行...]},
+          'footnote_block': [脚注区的各行]}
+    脚注区从 `------` 起到文件末尾，各行原样保留，包括行尾的两个空格（换行）。
+    脚注区中第一个脚注之前的其他行记在 `footnotes[None]` 中。
+    """
+    by_key = {}
+    by_content = {}
+    footnotes = {}
+    footnote_block = None
+    pending = None  # (位置, 原文行)，等待其译文行
+    chapter_no = 0
+    for (_, raw, line_info) in iter_lines(trans_path):
+        type = line_info.type
+        if footnote_block is not None or type in (LineInfo.FOOTNOTE_SIGN, LineInfo.FOOTNOTE):
+            if footnote_block is None:
+                footnote_block = []
+                footnote = footnotes[None] = []
+            raw = raw.rstrip("\n")
+            footnote_block.append(raw)
+            if type == LineInfo.FOOTNOTE:
+                footnote = footnotes[line_info.prefix] = [raw]
+            elif type != LineInfo.FOOTNOTE_SIGN and raw.strip():
+                footnote.append(raw)
+        elif type in (LineInfo.BOOK, LineInfo.CHAPTER, LineInfo.VERSE, LineInfo.PREV):
+            if type == LineInfo.CHAPTER:
+                chapter_no += 1
+            pending = (_trans_key(chapter_no, line_info), raw.strip())
+        elif type in (LineInfo.TRANS, LineInfo.TRANS_PREV) and pending is not None:
+            raw = raw.rstrip("\n")  # 译文行原样保留，包括行尾空格
+            by_key[pending] = raw
+            by_content.setdefault(pending[1], (pending[0], raw))
+            pending = None
+    if not footnotes.get(None, True):
+        del footnotes[None]
+    return {'by_key': by_key, 'by_content': by_content,
+            'keys': {key: han for ((key, _), han) in by_key.items()}, 'footnotes': footnotes,
+            'footnote_block': footnote_block or []}
+
+class VerseDrift(NamedTuple):
+    """原文与译文文件中原文行的一处差异，由 `check_drift()` 生成。"""
+    kind: str               # "added": 原文有、译文无；"removed": 译文有、原文无；"modified": 内容不同
+    path: str               # 译文文件路径
+    chapter_no: int         # 从 1 开始，书名行为 0
+    key: str                # 书名/章标题/概述/节号，见 `_line_key()`
+    origin_line: int|None   # 原文文件中的行号
+    trans_line: int|None    # 译文文件中的行号
+    origin: str|None        # 原文文件中的内容
+    trans: str|None         # 译文文件中的内容
+
+    def format(self) -> str:
+        where = f"第 {self.chapter_no} 章 {self.key}" if self.chapter_no else self.key
+        if self.kind == "added":
+            return f"🟡 {where}: 原文新增 (原文行-{self.origin_line})"
+        if self.kind == "removed":
+            return f"🟡 {where}: 原文已删除 (译文行-{self.trans_line})"
+        return f"🔴 {where}: 原文有改动 (原文行-{self.origin_line}, 译文行-{self.trans_line})"
+
+
+def _hash_lat_lines(path: str) -> tuple[dict, bytes]:
+    """逐行读取原文或译文文件，计算每个原文行（书名、章标题、概述、小节）的哈希值。
+
+    返回 ({(章序号, 位置, 第几次出现): (行号, 哈希值, 原行)}, 全书哈希值)。
+    按章序号而不是章标题定位，章标题改动时其下各节仍能对应上。
+    """
+    lines = {}
+    book_digest = hashlib.blake2b(digest_size=16)
+    chapter_no = 0
+    seen = Counter()
+    for (no, raw, line_info) in iter_lines(path):
+        type = line_info.type
+        if type not in (LineInfo.BOOK, LineInfo.CHAPTER, LineInfo.VERSE, LineInfo.PREV):
+            continue
+        if type == LineInfo.CHAPTER:
+            chapter_no += 1
+        key = (chapter_no, _line_key(line_info) or line_info.content)
+        seen[key] += 1
+        digest = hashlib.blake2b(raw.strip().encode("utf-8"), digest_size=8).digest()
+        book_digest.update(digest)
+        lines[key + (seen[key],)] = (no, digest, raw)
+    return (lines, book_digest.digest())
+
+@_profiled("check_drift")
+def check_drift(origin_path: str, trans_path: str) -> list[VerseDrift]:
+    """比较原文文件与其译文文件中照抄的原文行，找出新增、删除和改动的小节，不输出内容。
+
+    两个文件各读一遍，每行只保留哈希值；全书的哈希值相同时直接返回空列表。
+    结果按译文中的顺序排列，原文新增的排在最后。
+    """
+    with _stage("check_drift", trans_path):
+        (origin, origin_digest) = _hash_lat_lines(origin_path)
+        (trans, trans_digest) = _hash_lat_lines(trans_path)
+        if origin_digest == trans_digest:
+            return []
+        drifts = []
+        for (key, (trans_no, digest, trans_raw)) in trans.items():
+            found = origin.get(key)
+            if found is None:
+                drifts.append(VerseDrift("removed", trans_path, key[0], key[1], None, trans_no,
+                                         None, trans_raw.strip()))
+            elif found[1] != digest:
+                drifts.append(VerseDrift("modified", trans_path, key[0], key[1], found[0], trans_no,
+                                         found[2].strip(), trans_raw.strip()))
+        for (key, (origin_no, _, origin_raw)) in origin.items():
+            if key not in trans:
+                drifts.append(VerseDrift("added", trans_path, key[0], key[1], origin_no, None,
+                                         origin_raw.strip(), None))
+    return drifts
+
+def check_drift_dirs(origin_dir: str, trans_dir: str) -> list[VerseDrift]:
+    """比较两个目录中同名的原文和译文文件，如 `原文/` 和 `漢字對照/`，输出找到的差异。
+
+    只比较文件名以 "数字、" 开头的文件；只在一边存在的文件会给出提示。
+    返回全部 `VerseDrift`。
+    """
+    def book_files(folder: str) -> dict[str, pathlib.Path]:
+        return {path.name: path for path in pathlib.Path(folder).glob("*.md")
+                if re.match(r"\d+、", path.name)}
+    origins = book_files(origin_dir)
+    transes = book_files(trans_dir)
+    drifts = []
+    for name in sorted(origins.keys() | transes.keys(), key=lambda name: int(name.split("、")[0])):
+        if name not in transes:
+            print(f"🟡 {name}: 只有原文，尚未生成译文文件")
+            continue
+        if name not in origins:
+            print(f"🟡 {name}: 只有译文，没有对应的原文文件")
+            continue
+        file_drifts = check_drift(str(origins[name]), str(transes[name]))
+        if file_drifts:
+            counts = Counter(drift.kind for drift in file_drifts)
+            print(f"🟡 在 {transes[name]} 中: 改动 {counts['modified']}，"
+                  f"新增 {counts['added']}，删除 {counts['removed']}")
+            for drift in file_drifts:
+                print("    " + drift.format())
+        drifts.extend(file_drifts)
+    return drifts
+
+def patch_drift(drifts: list[VerseDrift]) -> int:
+    """把改动过的原文行写回译文文件，`> ` 开头的译文行不变，返回改动的行数。
+
+    只处理 "modified"；新增或删除的小节需要补写或删去译文，
+    请用 `generate_trans_file(..., merge=True)`。
+    写入前核对译文文件中该行仍是当时读到的内容，不一致的跳过。
+    """
+    by_path = {}
+    for drift in drifts:
+        if drift.kind == "modified":
+            by_path.setdefault(drift.path, {})[drift.trans_line] = drift
+    patched = 0
+    for (path, file_drifts) in by_path.items():
+        path = pathlib.Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(path, encoding="utf-8") as rf, open(tmp_path, "w", encoding="utf-8") as wf:
+            for no, line in enumerate(rf, 1):
+                drift = file_drifts.get(no)
+                if drift is not None:
+                    if line.strip() == drift.trans:
+                        line = drift.origin + "\n"
+                        patched += 1
+                    else:
+                        print(f"🟡 {path} 行-{no}: 内容已改变，跳过")
+                wf.write(line)
+        os.replace(tmp_path, path)
+    return patched
+
+
+def _load_trans_book(trans_path: str) -> Book:
+    """请使用 `load_trans_books()` 。"""
+    with _stage("load_trans_books", trans_path):
+        return _parse_trans_book(trans_path)
+
+def _parse_trans_book(trans_path: str) -> Book:
+    book = Book(trans_path)
+    lines = iter_lines(trans_path)
+    end = (0, "", LineInfo.BLANK)
+    def next_line() -> tuple[str, LineInfo]:
+        return next(lines, end)[1:]
+    with contextlib.closing(lines):
+        handle_footnotes = False
+        for (line_no, line, line_info) in lines:
+            type = line_info.type
+
+            # 检测为书名行
+            if type == LineInfo.BOOK:
+                book.book_name.line_no = line_no
+                book.book_name.lat = line_info.content
+                if next_line()[0] != '\n':
+                    print(f"🔴 在 {trans_path} 中:")
+                    print(f"    行-{line_no}: 书名行下未空一行，函数中止！")
+                    return None
+                (han_line, han_line_info) = next_line()
+                if han_line_info.type != LineInfo.TRANS:
+                    print(f"🔴 在 {trans_path} 中:")
+                    print(f"    行-{line_no}: 书名行未翻译，函数中止！")
+                    return None
+                line_no += 2
+                book.book_name.han = han_line_info.content
+                if next_line()[0] != '\n':
+                    print(f"🔴 在 {trans_path} 中:")
+                    print(f"    行-{line_no}: 书名翻译行下未空一行，函数中止！")
+                    return None
+                line_no += 1
+
+            # 检测为章标题行
+            elif type == LineInfo.CHAPTER:
+                book.chapters.append(Chapter(line_no, line_info.content))
+                if next_line()[0] != '\n':
+                    print(f"🔴 在 {trans_path} 中:")
+                    print(f"    行-{line_no}: 章标题行下未空一行，函数中止！")
+                    return None
+                (han_line, han_line_info) = next_line()
+                if han_line_info.type != LineInfo.TRANS:
                     print(f"🔴 在 {trans_path} 中:")
                     print(f"    行-{line_no}: 章标题行未有对应的中文版本，函数中止！")
                     return None
                 line_no += 2
-                if f.readline() != '\n':
+                if next_line()[0] != '\n':
                     print(f"🔴 在 {trans_path} 中:")
                     print(f"    行-{line_no}: 章标题行下未空一行，函数中止！")
                     return None
@@ -492,19 +1821,16 @@ def _load_trans_book(trans_path: str) -> dict:
 
             # 检测为小节行或概述行
             elif type == LineInfo.VERSE or type == LineInfo.PREV:
-                if len(book['chapters']) == 0:
+                if len(book.chapters) == 0:
                     print(f"🔴 在 {trans_path} 中:")
                     print(f"    行-{line_no}: 该小节之前未创建章，函数中止！")
                     return None
-                _verse = {}
-                _verse['line_no'] = line_no
-                _verse['lat'] = line.strip()    # 保留原格式
-                if f.readline() != '\n':
+                _verse = Verse(line_no, line.strip(), None)    # 保留原格式
+                if next_line()[0] != '\n':
                     print(f"🔴 在 {trans_path} 中:")
                     print(f"    行-{line_no}: 小节行下未空一行，函数中止！")
                     return None
-                han_line = f.readline()
-                han_line_info = LineInfo(han_line.strip())
+                (han_line, han_line_info) = next_line()
                 if line_info.type == LineInfo.PREV and han_line_info.type != LineInfo.TRANS_PREV:
                     print(f"🔴 在 {trans_path} 中:")
                     print(f"    行-{line_no}: 概述行未翻译，函数中止！")
@@ -514,9 +1840,9 @@ def _load_trans_book(trans_path: str) -> dict:
                     print(f"    行-{line_no}: 小节行未翻译，函数中止！")
                     return None
                 line_no += 2
-                _verse['han'] = han_line.strip() # 保留原格式
-                book['chapters'][-1]['verses'].append(_verse)
-                if f.readline() != '\n':
+                _verse.han = han_line.strip() # 保留原格式
+                book.chapters[-1].verses.append(_verse)
+                if next_line()[0] != '\n':
                     print(f"🔴 在 {trans_path} 中:")
                     print(f"    行-{line_no}: 小节或概述翻译行下未空一行，函数中止！")
                     return None
@@ -529,7 +1855,7 @@ def _load_trans_book(trans_path: str) -> dict:
             elif type == LineInfo.FOOTNOTE_SIGN:
                 handle_footnotes = True
             elif handle_footnotes:
-                book['footnotes'].append(line.strip())
+                book.footnotes.append(line.strip())
             # 检测到未知行
             else:
                 print(f"🔴 在 {trans_path} 中:")
@@ -537,96 +1863,1842 @@ def _load_trans_book(trans_path: str) -> dict:
                 return None
     return book
 
-def load_trans_books(*trans_paths: str) -> Books|None:
-    """加载译文文本，保存为类似 json 数据对象。
+@_profiled("load_trans_books")
+def load_trans_books(*trans_paths: str, cache_dir: str=None, workers: int=None, lazy: bool=False) -> Books|None:
+    """加载译文文本，保存为 `Books` 对象。
 
     使用方式: 
         `books = load_trans_books(path1, path2, ...)`
+        `books = load_trans_books(path1, path2, ..., cache_dir=".cache")`
+        `books = load_trans_books(path1, path2, ..., workers=os.cpu_count())`
     载入失败则返回 `None`。
+
+    参数 `cache_dir`: 可选的缓存目录。给出时，每本书解析后的结果会保存在该目录中，
+    下次载入时文件未改动的书直接读取缓存，只重新解析改动过的书。
+
+    参数 `workers`: 可选的进程数。大于 1 时用多个进程同时解析各书，结果仍按参数顺序排列。
+
+    参数 `lazy`: 为 `True` 时不立即解析，返回 `LazyBooks`，用到某本书时才解析这本书，
+    `get_verse()` 只读出需要的几行。适合只查几个小节的脚本。
     ---
-    books 的格式如下:
+    books 的格式见 `Books`，仍可以像以前一样用 `book['chapters']` 这样的字典方式访问:
     ```
-    [{'book_name': {'line_no': 行号, 'lat': 原文, 'han': 译文},
-      'chapters':  [{'line_no': 行号, 
-                     'title': 标题(如'Mt. 4.'),
-                     'verses': [{'line_no': 行号, 
-                                 'lat': 原文, 
-                                 'han': 译文}, ...]
-                    }, ...],
-      'footnotes': ['xx', 'xx', ...]},
-     }, ...]
+    [Book(book_name=Verse(line_no=行号, lat=原文, han=译文),
+          chapters=[Chapter(line_no=行号,
+                            title=标题(如'Mt. 4.'),
+                            verses=[Verse(line_no=行号,
+                                          lat=原文,
+                                          han=译文), ...]
+                           ), ...],
+          footnotes=['xx', 'xx', ...]),
+     ...]
     ```
     """
+    if lazy:
+        return LazyBooks(trans_paths, cache_dir)
+    if cache_dir is None:
+        load = _load_trans_book
+    else:
+        load = functools.partial(_load_trans_book_cached, cache_dir=cache_dir)
     books = Books()
-    for path in trans_paths:
-        book = _load_trans_book(path)
+    for book in _map_books(load, trans_paths, workers):
         if book is None:
             return None
         else:
             books.append(book)
+            if _profiler is not None:
+                info = _profiler.books.setdefault(str(book.path), {})
+                info['chapters'] = len(book.chapters)
+                info['verses'] = sum(len(chapter.verses) for chapter in book.chapters)
+                _profiler.counts["verses"] += info['verses']
     return books
 
-def lat2han(lat:str, fenci:Counter) -> str:
-    # 未完善
-    result = []
-    lat = lat.lower()
-    lat = re.sub(r"\[.+?\]", "", lat) # 去除中括号及内容
-    items = re.findall("[0-9] |[0-9,.;:‘’“”!?()—]|['a-zA-ZÜüÔôÖöÆæ-]+", lat)
-    punc_trans = str.maketrans(",.;:‘’“”!?()", "，。；：‘’“”！？（）")
-    re_ci = re.compile("['a-zA-ZÜüÔôÖöÆæ-]+")
-    fc_list = fenci.most_common()
-    for item in items:
-        if re_ci.search(item) != None:  # 为词
-            ci = None
-            for ((la,ha),_) in fc_list:
-                if la == item:
-                    ci = ha
-                    break
-            if not ci:
-                ci = item
-            result.append(ci)
-        elif item[0] in "0123456789":
-            result.append(item)
-        elif item == '—':
-            result.append('——')
+def _map_books(func, paths, workers: int=None):
+    """对每个文件调用 `func(path)`，按 `paths` 的顺序逐个返回结果。
+
+    `workers` 大于 1 时在进程池中执行。子进程中的输出会先收集起来，
+    再在主进程中按顺序打印，避免多本书的提示信息混在一起。
+    """
+    if workers is None or workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield func(path)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        for (result, output) in executor.map(_call_captured, itertools.repeat(func), paths):
+            print(output, end="")
+            yield result
+
+def _call_captured(func, *args):
+    """调用 `func(*args)`，返回 (结果, 期间打印的内容)。"""
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        result = func(*args)
+    return (result, buffer.getvalue())
+
+_CACHE_VERSION = 2  # 书的数据格式改变时加一，使旧缓存失效
+
+def _load_trans_book_cached(trans_path: str, cache_dir: str) -> Book:
+    """带缓存的 `_load_trans_book()`。
+
+    缓存按文件分别保存，先比较 修改时间 和 大小，不同时再比较内容的哈希值，
+    内容未变就只更新缓存中的修改时间。
+    """
+    path = pathlib.Path(trans_path).resolve()
+    cache_path = pathlib.Path(cache_dir) / (hashlib.sha1(str(path).encode("utf-8")).hexdigest() + ".pickle")
+    stat = path.stat()
+    cached = None
+    if cache_path.exists():
+        try:
+            with open(cache_path, "rb") as f:
+                cached = pickle.load(f)
+        except Exception:   # 缓存损坏等，重新解析即可
+            cached = None
+        if cached is not None and cached.get('version') != _CACHE_VERSION:
+            cached = None
+    if cached is not None and cached['mtime_ns'] == stat.st_mtime_ns and cached['size'] == stat.st_size:
+        _count("cache.books.hit")
+        return cached['book']
+    digest = hashlib.sha1(path.read_bytes()).hexdigest()
+    if cached is not None and cached['sha1'] == digest:
+        _count("cache.books.hit")
+        book = cached['book']
+    else:
+        _count("cache.books.miss")
+        book = _load_trans_book(trans_path)
+        if book is None:
+            return None
+    _write_pickle_atomic(cache_path, {
+        'version': _CACHE_VERSION,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha1': digest,
+        'book': book,
+    })
+    return book
+
+def _write_pickle_atomic(path: pathlib.Path, obj) -> None:
+    """先写入临时文件再替换，避免中断时留下不完整的文件。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+class LazyBooks(Books):
+    """按需载入的 `Books`，由 `load_trans_books(..., lazy=True)` 生成。
+
+    创建时不解析任何文件。`get_verse()` 只根据各书的行偏移索引读出需要的几行；
+    用下标访问或遍历某本书时才完整解析这本书，之后保存在列表中重复使用。
+    需要统计全部书时，可以用 `stream()` 逐本解析而不保留。
+
+    行偏移索引记录每章、每小节所在行的字节偏移和行号，扫描一遍文件即可生成，
+    比完整解析快得多。给出 `cache_dir` 时保存到该目录，文件未改动就直接读取。
+    """
+
+    def __init__(self, trans_paths, cache_dir: str=None) -> None:
+        super().__init__([None] * len(trans_paths))
+        self.paths = list(trans_paths)
+        self.cache_dir = cache_dir
+        self._offsets = {}      # {book_no: 行偏移索引}，见 `_scan_book_offsets()`
+
+    def _load(self, book_index: int) -> Book:
+        book = list.__getitem__(self, book_index)
+        if book is None:
+            path = self.paths[book_index]
+            if self.cache_dir is None:
+                book = _load_trans_book(path)
+            else:
+                book = _load_trans_book_cached(path, self.cache_dir)
+            if book is None:
+                raise ValueError(f"载入失败: {path}")
+            _count("lazy.books.load")
+            list.__setitem__(self, book_index, book)
+        return book
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._load(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("book index out of range")
+        return self._load(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self._load(index)
+
+    def __reversed__(self):
+        for index in reversed(range(len(self))):
+            yield self._load(index)
+
+    def __setitem__(self, index, book) -> None:
+        super().__setitem__(index, book)
+        # 书被替换后偏移可能不再对应
+        if isinstance(index, slice):
+            self._offsets.clear()
         else:
-            result.append(item.translate(punc_trans))
-    return "".join(result)
+            self._offsets.pop(index % len(self) + 1, None)
+
+    def is_loaded(self, book_no: int) -> bool:
+        """第 `book_no` 本书是否已完整解析。"""
+        return list.__getitem__(self, book_no - 1) is not None
+
+    def stream(self):
+        """逐本返回各书，未载入的书解析后不保留，适合一次性的统计。"""
+        for index in range(len(self)):
+            book = list.__getitem__(self, index)
+            if book is None:
+                book = _load_trans_book(self.paths[index])
+                if book is None:
+                    raise ValueError(f"载入失败: {self.paths[index]}")
+            yield book
+
+    def get_verse(self, book_no: int|str, chapter_no: int, verse_no: int) -> Verse|None:
+        """同 `Books.get_verse()`。书未载入时只读出这一小节所在的几行。"""
+        book_no = Books._book_no(book_no)
+        if book_no is None or not 1 <= book_no <= len(self) or self.is_loaded(book_no):
+            return super().get_verse(book_no if book_no is not None else "", chapter_no, verse_no)
+        with _stage("lazy.get_verse"):
+            offsets = self.book_offsets(book_no)
+            chapters = offsets['chapters']
+            if not (1 <= chapter_no <= len(chapters) and 0 <= verse_no < len(chapters[chapter_no-1][2])):
+                print("未找到该小节！")
+                return None
+            (_, _, line_nos, positions) = chapters[chapter_no-1]
+            with open(self.paths[book_no-1], "rb") as f:
+                f.seek(positions[verse_no])
+                lat = f.readline().decode("utf-8")
+                f.readline()
+                han = f.readline().decode("utf-8")
+            han_type = LineInfo(han).type
+            if han_type != LineInfo.TRANS and han_type != LineInfo.TRANS_PREV:
+                # 格式有误，交给完整解析输出具体的提示
+                return super().get_verse(book_no, chapter_no, verse_no)
+            _count("lazy.verses.read")
+            return Verse(line_nos[verse_no], lat.strip(), han.strip())
+
+    def book_offsets(self, book_no: int) -> dict:
+        """第 `book_no` 本书的行偏移索引，文件改动过时重新扫描。"""
+        path = self.paths[book_no-1]
+        stat = os.stat(path)
+        offsets = self._offsets.get(book_no)
+        if offsets is not None and (offsets['mtime_ns'], offsets['size']) == (stat.st_mtime_ns, stat.st_size):
+            return offsets
+        cache_path = None
+        if self.cache_dir is not None:
+            key = hashlib.sha1(str(pathlib.Path(path).resolve()).encode("utf-8")).hexdigest()
+            cache_path = pathlib.Path(self.cache_dir) / (key + ".offsets.pickle")
+            try:
+                with open(cache_path, "rb") as f:
+                    offsets = pickle.load(f)
+            except Exception:   # 没有缓存或缓存损坏，重新扫描即可
+                offsets = None
+        if offsets is None or offsets.get('version') != _OFFSETS_VERSION \
+                or (offsets['mtime_ns'], offsets['size']) != (stat.st_mtime_ns, stat.st_size):
+            _count("cache.offsets.miss")
+            offsets = _scan_book_offsets(path)
+            if cache_path is not None:
+                _write_pickle_atomic(cache_path, offsets)
+        else:
+            _count("cache.offsets.hit")
+        self._offsets[book_no] = offsets
+        return offsets
+
+
+_OFFSETS_VERSION = 1
+
+def _scan_book_offsets(trans_path: str) -> dict:
+    """扫描一遍译文文件，记录各章标题以及各小节（含概述小节）原文行的字节偏移和行号。
+
+    只看行首标记，不检查格式，也不解码整行，所以比 `_parse_trans_book()` 快得多。
+    返回 {'version', 'mtime_ns', 'size', 'chapters': [(行号, 标题, 各小节行号, 各小节偏移), ...]}。
+    """
+    with _stage("scan_book_offsets", trans_path):
+        stat = os.stat(trans_path)
+        chapters = []
+        position = 0
+        with open(trans_path, "rb") as f:
+            for line_no, line in enumerate(f, 1):
+                if line.startswith(b"## "):
+                    title = line[3:].decode("utf-8").rstrip("\r\n")
+                    chapters.append((line_no, title, array.array('I'), array.array('Q')))
+                elif (line.startswith("·".encode("utf-8")) or line.startswith(b"**_")) and chapters:
+                    chapters[-1][2].append(line_no)
+                    chapters[-1][3].append(position)
+                elif line.startswith(b"------"):
+                    break   # 之后都是脚注
+                position += len(line)
+    return {
+        'version': _OFFSETS_VERSION,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'chapters': chapters,
+    }
+
+
+class Lat2Han:
+    """罗马字转汉字的转换器。根据分词统计构建一次索引，之后可反复使用。
+
+    使用方式:
+        `l2h = Lat2Han(fenci)` 或 `l2h = Lat2Han.from_csv("fenci.csv")`
+        `l2h.translate(lat)`、`l2h.translate_many(lines)`
+    ---
+    每个罗马字词取统计次数最多的汉字写法，次数相同时取先出现者，
+    与 `fenci.most_common()` 的顺序一致。
+    """
+
+    _re_note = re.compile(r"\[.+?\]")    # 用于 去除 [...]
+    _re_item = re.compile("[0-9] |[0-9,.;:‘’“”!?()—]|['a-zA-ZÜüÔôÖöÆæ-]+")
+    _punc = dict(zip(",.;:‘’“”!?()", "，。；：‘’“”！？（）"))
+    _punc['—'] = '——'
+
+    @_profiled("Lat2Han")
+    def __init__(self, fenci: Counter) -> None:
+        """参数 `fenci`: 分词统计。 {(lat, han): count}"""
+        best = {}   # lat: (han, count)
+        for (lat, han), count in fenci.items():
+            if lat not in best or count > best[lat][1]:
+                best[lat] = (han, count)
+        self.index = {lat: han for lat, (han, _) in best.items()}
+        # 词和标点放进同一张表，一次查表完成转换；查不到的（数字、未知词）原样输出
+        self._table = dict(Lat2Han._punc)
+        self._table.update((lat, han) for lat, han in self.index.items() if han)
+
+    @classmethod
+    def from_csv(cls, csv_path: str) -> "Lat2Han":
+        """从 `fenci.csv`（列: ,lat,han,count）构建。"""
+        return cls(load_fenci_csv(csv_path))
+
+    def translate(self, lat: str) -> str:
+        """转换一行罗马字文本。"""
+        _count("lat2han.lines")
+        lat = Lat2Han._re_note.sub("", lat.lower()) # 去除中括号及内容
+        table = self._table
+        return "".join([table.get(item, item) for item in Lat2Han._re_item.findall(lat)])
+
+    def translate_many(self, lines) -> list[str]:
+        """批量转换多行罗马字文本。"""
+        return [self.translate(line) for line in lines]
+
+
+def load_fenci_csv(csv_path: str) -> Counter:
+    """读取 `fenci.csv` 这类分词统计表，返回 `Counter`。 {(lat, han): count}"""
+    counter = Counter()
+    with open(csv_path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            counter[(row['lat'], row['han'])] += int(row['count'])
+    return counter
 
-def han2lat(han:str, fenzi:Counter) -> str:
+def lat2han(lat:str, fenci: "Counter|Lat2Han") -> str:
     # 未完善
-    result = []
-    need_space = False
-    for item in han:
-        if re.match(RE_HAN, item) == None:
-            result.append(item)
-            need_space = False
-            continue
-        duoyinzi = []
-        if need_space:
-            result.append(" ")
-        for (z_lat, z_han) in fenzi.keys():
-            if item == z_han:
-                duoyinzi.append(z_lat)
-        if len(duoyinzi) == 0:
-            result.append(item)
-        elif len(duoyinzi) == 1:
-            result.append(duoyinzi[0])
+    # 需多次转换时，请先构建 `Lat2Han(fenci)` 再传入，避免每次重建索引。
+    if not isinstance(fenci, Lat2Han):
+        fenci = Lat2Han(fenci)
+    return fenci.translate(lat)
+
+class Han2Lat:
+    """汉字转罗马字的转换器。根据分字统计构建 汉字→读音 的反向索引，
+    每个汉字（含 `{…}` 写法）的读音按统计次数从多到少排列。
+
+    使用方式:
+        `h2l = Han2Lat(fenzi)`
+        `h2l.translate(han)`、`h2l.translate_many(lines)`、`h2l.translate_file(from_path, to_path)`
+    """
+
+    _re_han = re.compile(RE_HAN)
+
+    @_profiled("Han2Lat")
+    def __init__(self, fenzi: Counter) -> None:
+        """参数 `fenzi`: 分字统计。 {(lat, han): count}"""
+        index = {}  # han: {lat: count}
+        for (lat, han), count in fenzi.items():
+            readings = index.setdefault(han, {})
+            readings[lat] = readings.get(lat, 0) + count
+        # sorted 是稳定排序，次数相同时保持统计中的先后顺序
+        self.index = {
+            han: sorted(readings.items(), key=lambda item: item[1], reverse=True)
+            for han, readings in index.items()
+        }
+        self._joined = {han: "/".join(lat for lat, _ in readings)
+                        for han, readings in self.index.items()}
+
+    def readings(self, han: str) -> list[str]:
+        """获取一个汉字的全部读音，按次数从多到少排列。"""
+        return [lat for lat, _ in self.index.get(han, ())]
+
+    def reading_stats(self, han: str) -> list[tuple[str, int, float]]:
+        """获取一个汉字各读音的统计。返回 [(lat, count, 占比), ...]"""
+        readings = self.index.get(han, ())
+        total = sum(count for _, count in readings)
+        return [(lat, count, count / total) for lat, count in readings]
+
+    def polyphones(self, min_readings: int=2) -> dict[str, list[tuple[str, int, float]]]:
+        """获取所有多音字的读音统计，按该字总次数从多到少排列。
+
+        返回 {han: [(lat, count, 占比), ...]}
+        """
+        hans = [han for han, readings in self.index.items() if len(readings) >= min_readings]
+        hans.sort(key=lambda han: sum(count for _, count in self.index[han]), reverse=True)
+        return {han: self.reading_stats(han) for han in hans}
+
+    def translate(self, han: str) -> str:
+        """转换一行汉字文本。多音字以 `/` 连接全部读音，未收录的字原样输出。"""
+        _count("han2lat.lines")
+        result = []
+        joined = self._joined
+        end = 0
+        for match in Han2Lat._re_han.finditer(han):
+            start = match.start()
+            if start > end:
+                result.append(han[end:start])
+            elif result:    # 紧跟在上一个汉字后面
+                result.append(" ")
+            item = match.group()
+            result.append(joined.get(item, item))
+            end = match.end()
+        result.append(han[end:])
+        return "".join(result)
+
+    def translate_many(self, lines) -> list[str]:
+        """批量转换多行汉字文本。"""
+        return [self.translate(line) for line in lines]
+
+    def iter_file(self, path: str):
+        """逐行读取文本文件并转换，以生成器方式返回（保留换行符）。"""
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                yield self.translate(line)
+
+    def translate_file(self, from_path: str, to_path: str) -> None:
+        """转换整个文件，结果写入 `to_path`。"""
+        if from_path == to_path:
+            print("🔴 警告: 原文路径不能与目标路径相同！")
+            return
+        with open(to_path, "w", encoding="utf-8") as wf:
+            wf.writelines(self.iter_file(from_path))
+        print(f"已完成，请查看 {to_path}")
+
+
+def han2lat(han:str, fenzi: "Counter|Han2Lat") -> str:
+    # 未完善
+    # 需多次转换时，请先构建 `Han2Lat(fenzi)` 再传入，避免每次重建索引。
+    if not isinstance(fenzi, Han2Lat):
+        fenzi = Han2Lat(fenzi)
+    return fenzi.translate(han)
+
+
+class Vocab:
+    """字符串与整数编号的对照表。编号从 0 开始，按首次出现的顺序分配。"""
+
+    def __init__(self) -> None:
+        self.ids = collections.defaultdict(itertools.count().__next__)   # {字符串: 编号}，未收录时自动分配
+        self._items = []
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def items(self) -> list[str]:
+        """编号 → 字符串。字典按插入顺序排列，顺序即编号。"""
+        if len(self._items) != len(self.ids):
+            self._items = list(self.ids)
+        return self._items
+
+    def encode(self, items) -> array.array:
+        """把字符串序列转为编号数组，未收录的字符串会加入表中。"""
+        return array.array('I', map(self.ids.__getitem__, items))
+
+    def get(self, item: str) -> int|None:
+        """获取编号，未收录时返回 `None`（不会加入表中）。"""
+        return self.ids.get(item)
+
+
+class CoOccurrence:
+    """分字（或分词）的 罗马字×汉字 共现矩阵，用整数编号存储。
+
+    罗马字和汉字分别编号（`lat_vocab`、`han_vocab`），每个对齐的小节存为两个编号数组，
+    全部小节依次连接在 `lat_ids`、`han_ids` 中，`book_offsets[i]` 是第 i+1 本书的起点。
+    矩阵以稀疏形式保存：{(lat_id, han_id) 合成的整数: 次数}，总计和各书分别保存，
+    计数在 C 层完成（`Counter` 直接统计整数数组），查询时只看用到的行。
+
+    使用方式:
+        `co = CoOccurrence(books)`                      # 默认分字，`zi=False` 为分词
+        `co.readings("個", k=3)`                        # 某字最常见的几个读音
+        `co.polyphones(min_readings=4)`                 # 读音多于 3 个的字
+        `co.book_distribution("個")`                    # 各书中的读音分布
+        `co.to_numpy()`、`co.to_scipy()`                # 需要 numpy / scipy
+    ---
+    与 `books.fenci()` 一样，原文和译文字数不符的小节不计入；`to_counter()` 的结果与其相同。
+    """
+
+    _HAN_BITS = 32
+
+    @_profiled("CoOccurrence")
+    def __init__(self, books: Books, zi: bool=True) -> None:
+        self.zi = zi
+        self.lat_vocab = Vocab()
+        self.han_vocab = Vocab()
+        self.lat_ids = array.array('I')
+        self.han_ids = array.array('I')
+        self.book_offsets = array.array('Q')
+        self.book_counts = []   # 各书的 Counter {pair: count}
+        shift = CoOccurrence._HAN_BITS
+        for book in books:
+            self.book_offsets.append(len(self.lat_ids))
+            start = len(self.lat_ids)
+            for verse in itertools.chain((book.book_name,),
+                                         (v for chapter in book.chapters for v in chapter.verses)):
+                tokens = verse.tokens()
+                if len(tokens.lat_zi) != len(tokens.han_zi):
+                    continue
+                if zi:
+                    (lat, han) = (tokens.lat_zi, tokens.han_zi)
+                else:
+                    (lat, han) = (tokens.lat_ci, tokens.han_ci)
+                self.lat_ids.extend(self.lat_vocab.encode(lat))
+                self.han_ids.extend(self.han_vocab.encode(han))
+            pairs = map(int.__or__, map(shift.__rlshift__, self.lat_ids[start:]), self.han_ids[start:])
+            self.book_counts.append(Counter(pairs))
+        self.counts = Counter()
+        for counter in self.book_counts:
+            self.counts.update(counter)
+        self._rows = None   # {han_id: [(lat_id, count), ...]}，按次数从多到少排列
+
+    def _pair(self, code: int) -> tuple[int, int]:
+        return (code >> CoOccurrence._HAN_BITS, code & ((1 << CoOccurrence._HAN_BITS) - 1))
+
+    def _han_rows(self) -> dict[int, list[tuple[int, int]]]:
+        if self._rows is None:
+            rows = {}
+            for (code, count) in self.counts.items():
+                (lat_id, han_id) = self._pair(code)
+                rows.setdefault(han_id, []).append((lat_id, count))
+            for row in rows.values():
+                row.sort(key=lambda item: item[1], reverse=True)
+            self._rows = rows
+        return self._rows
+
+    def readings(self, han: str, k: int=None) -> list[tuple[str, int, float]]:
+        """某汉字（或汉字词）最常见的 `k` 个读音。返回 [(lat, count, 占比), ...]"""
+        han_id = self.han_vocab.get(han)
+        row = self._han_rows().get(han_id, []) if han_id is not None else []
+        total = sum(count for _, count in row)
+        items = self.lat_vocab.items
+        return [(items[lat_id], count, count / total) for (lat_id, count) in row[:k]]
+
+    def polyphones(self, min_readings: int=2) -> list[tuple[str, int, int, float]]:
+        """读音数不少于 `min_readings` 的字，按总次数从多到少排列。
+
+        返回 [(han, 读音数, 总次数, 最常见读音的占比), ...]
+        """
+        result = []
+        items = self.han_vocab.items
+        for (han_id, row) in self._han_rows().items():
+            if len(row) >= min_readings:
+                total = sum(count for _, count in row)
+                result.append((items[han_id], len(row), total, row[0][1] / total))
+        result.sort(key=lambda item: item[2], reverse=True)
+        return result
+
+    def book_distribution(self, han: str) -> dict[int, dict[str, int]]:
+        """某汉字在各书中的读音分布。返回 {book_no: {lat: count}}，只含出现过的书。"""
+        han_id = self.han_vocab.get(han)
+        if han_id is None:
+            return {}
+        codes = [(lat_id << CoOccurrence._HAN_BITS) | han_id for (lat_id, _) in self._han_rows()[han_id]]
+        items = self.lat_vocab.items
+        distribution = {}
+        for book_no, counter in enumerate(self.book_counts, 1):
+            readings = {items[code >> CoOccurrence._HAN_BITS]: counter[code] for code in codes if code in counter}
+            if readings:
+                distribution[book_no] = readings
+        return distribution
+
+    def to_counter(self) -> Counter:
+        """转回 `books.fenci()` 格式的 Counter。 {(lat, han): count}"""
+        lat_items = self.lat_vocab.items
+        han_items = self.han_vocab.items
+        counter = Counter()
+        for (code, count) in self.counts.items():
+            (lat_id, han_id) = self._pair(code)
+            counter[(lat_items[lat_id], han_items[han_id])] = count
+        return counter
+
+    def to_numpy(self, book_no: int=None):
+        """以 COO 格式返回 (lat_ids, han_ids, counts) 三个 numpy 数组。需要安装 numpy。
+
+        `book_no`: 可选，只取某本书（从 1 开始）。
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            raise ImportError("to_numpy() 需要 numpy，请先 pip install numpy") from None
+        counter = self.counts if book_no is None else self.book_counts[book_no-1]
+        codes = np.fromiter(counter.keys(), dtype=np.uint64, count=len(counter))
+        counts = np.fromiter(counter.values(), dtype=np.int64, count=len(counter))
+        shift = np.uint64(CoOccurrence._HAN_BITS)
+        lat_ids = (codes >> shift).astype(np.int64)
+        han_ids = (codes & np.uint64((1 << CoOccurrence._HAN_BITS) - 1)).astype(np.int64)
+        return (lat_ids, han_ids, counts)
+
+    def to_scipy(self, book_no: int=None):
+        """返回 罗马字×汉字 的 `scipy.sparse.csr_matrix`，行、列编号见 `lat_vocab`、`han_vocab`。
+        需要安装 numpy 和 scipy。"""
+        try:
+            from scipy import sparse
+        except ImportError:
+            raise ImportError("to_scipy() 需要 scipy，请先 pip install scipy") from None
+        (lat_ids, han_ids, counts) = self.to_numpy(book_no)
+        shape = (len(self.lat_vocab), len(self.han_vocab))
+        return sparse.coo_matrix((counts, (lat_ids, han_ids)), shape=shape).tocsr()
+
+
+class KwicLine(NamedTuple):
+    """索引（KWIC）中的一行，由 `iter_concordance()` 生成。"""
+    lat: str                # 分词（小写）
+    han: str
+    book_no: int
+    chapter_no: int
+    verse_no: int
+    line_no: int
+    lat_left: str
+    lat_word: str           # 原文中的写法，保留大小写
+    lat_right: str
+    han_left: str
+    han_word: str
+    han_right: str
+
+    @property
+    def ref(self) -> str:
+        return f"{self.book_no}.{self.chapter_no}.{self.verse_no}"
+
+
+# 小节开头的标记和节号，如 "·9 "、"> 9 "、"> **_"，不算作上下文
+_re_kwic_prefix = re.compile(r"(?:> )?(?:·|\*\*_)?\d*\s*")
+
+def _kwic_context(text: str, span: tuple[int, int], width: int, sep: str="") -> tuple[str, str, str]:
+    """截取 `span` 左右各约 `width` 个字符。给出 `sep` 时在分隔符处截断，不切开单词。"""
+    (start, end) = span
+    lo = min(start, _re_kwic_prefix.match(text).end())
+    hi = len(text) - 3 if text.endswith("_**") and end <= len(text) - 3 else len(text)
+    left = text[max(lo, start - width):start]
+    right = text[end:min(hi, end + width)]
+    if start - lo > width:
+        if sep and sep in left:
+            left = left[left.index(sep) + 1:]
+        left = "…" + left
+    if hi - end > width:
+        if sep and sep in right:
+            right = right[:right.rindex(sep)]
+        right = right + "…"
+    return (left, text[start:end], right)
+
+def iter_concordance(books: Books, vocab=None, width: int=30, sort: str="ref"):
+    """以生成器方式返回全部分词（或 `vocab` 中的词）的 `KwicLine`，按词分组。
+
+    只遍历 books 一次（即构建 `books.ci_index`，已构建时直接使用），不必对每个词调用一次 `find_ci_pair()`。
+
+    `vocab`: 可选，要列出的词。元素可以是罗马字词（列出其全部写法）
+             或 (lat, han) 对，因此 `load_fenci_csv()` 的结果可以直接传入。
+    `width`: 原文左右各保留的字符数，译文为其三分之一。
+    `sort`:  各组内的顺序，"ref" 按书卷章节，"left"/"right" 按左/右文。
+
+    各组按罗马字排序，同一罗马字的各写法按出现次数从多到少排列。
+    """
+    index = books.ci_index
+    if vocab is None:
+        pairs = index.by_pair.keys()
+    else:
+        pairs = set()
+        for item in vocab:
+            if isinstance(item, str):
+                pairs.update((item.lower(), han) for han in index.translations(item))
+            else:
+                pairs.add((item[0].lower(), item[1]))
+    by_lat = {}
+    for (lat, han) in pairs:
+        postings = index.by_pair.get((lat, han))
+        if postings:
+            by_lat.setdefault(lat, []).append((han, postings))
+    han_width = max(1, width // 3)
+    for lat in sorted(by_lat, key=lambda lat: (lat.replace("-", " "), lat)):
+        for (han, postings) in sorted(by_lat[lat], key=lambda item: (-len(item[1]), item[0])):
+            lines = []
+            for p in postings:
+                verse = books[p.book_no-1].chapters[p.chapter_no-1].verses[p.verse_no]
+                lines.append(KwicLine(lat, han, p.book_no, p.chapter_no, p.verse_no, verse.line_no,
+                                      *_kwic_context(verse.lat, p.lat_span, width, " "),
+                                      *_kwic_context(verse.han, p.han_span, han_width)))
+            if sort == "left":
+                lines.sort(key=lambda line: line.lat_left.rstrip()[::-1].lower())
+            elif sort == "right":
+                lines.sort(key=lambda line: line.lat_right.lstrip().lower())
+            yield from lines
+
+def write_concordance(books: Books, path: str, vocab=None, width: int=30, sort: str="ref",
+                      format: str=None) -> int:
+    """把 `iter_concordance()` 的结果逐行写入 Markdown 或 CSV 文件，返回写入的行数。
+
+    `format`: "md" 或 "csv"，不给出时根据 `path` 的扩展名判断。
+    文件先写到临时文件，完成后再替换，中途出错不会留下不完整的文件。
+    """
+    if format is None:
+        format = "csv" if str(path).lower().endswith(".csv") else "md"
+    if format not in ("md", "csv"):
+        raise ValueError(f"不支持的格式: {format}")
+    count = 0
+    tmp_path = f"{path}.tmp"
+    with _stage("write_concordance"), open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        if format == "csv":
+            writer = csv.writer(f)
+            writer.writerow(KwicLine._fields)
+            for line in iter_concordance(books, vocab, width, sort):
+                writer.writerow(line)
+                count += 1
         else:
-            result.append("/".join(duoyinzi))
-        need_space = True
-    return "".join(result)
+            escape = lambda text: text.replace("|", "\\|")
+            group = None
+            for line in iter_concordance(books, vocab, width, sort):
+                if line.lat != (group or (None,))[0]:
+                    f.write(f"\n## {line.lat}\n")
+                if (line.lat, line.han) != group:
+                    group = (line.lat, line.han)
+                    f.write(f"\n### {line.lat} {line.han} ({len(books.ci_index.by_pair[group])})\n\n"
+                            "| 出处 | 行号 | 左文 | 原文 | 右文 | 左文 | 译文 | 右文 |\n"
+                            "| ---- | ---: | ---: | :--: | :--- | ---: | :--: | :--- |\n")
+                f.write(f"| {books[line.book_no-1].book_name.han} {line.chapter_no}.{line.verse_no} "
+                        f"| {line.line_no} | {escape(line.lat_left)} | **{escape(line.lat_word)}** "
+                        f"| {escape(line.lat_right)} | {escape(line.han_left)} | **{escape(line.han_word)}** "
+                        f"| {escape(line.han_right)} |\n")
+                count += 1
+    os.replace(tmp_path, path)
+    return count
+
+
+class VariantGroup(NamedTuple):
+    """一致性报告中的一组，由 `find_variants()` 生成。"""
+    key: str                # 罗马字词（`by="lat"`）或汉字词（`by="han"`）
+    total: int              # 出现次数
+    entropy: float          # 各写法分布的熵（比特），越大越不统一
+    minority_share: float   # 非最常见写法所占的比例
+    placeholder_mixed: bool # 部分写法用了 {…}，部分没有
+    variants: list          # [(写法, 次数, [CiPosting, ...]), ...]，按次数从多到少排列，
+                            # 只有少数写法收集了位置
+
+
+def find_variants(books: Books, by: str="lat", min_count: int=2, sort: str="entropy") -> list[VariantGroup]:
+    """找出同一个词有多种写法的情况：`by="lat"` 时为同一罗马字词的不同汉字写法，
+    `by="han"` 时为同一汉字词的不同罗马字拼法。
+
+    `min_count`: 出现次数少于此数的词不列出。
+    `sort`: "entropy" 按熵、"minority" 按少数写法的比例，从大到小排列。
+
+    先遍历一遍各小节的分词统计各写法，再遍历一遍只为少数写法记下位置，
+    不需要逐个猜测后调用 `find_ci_pair()`，也不必构建整个分词索引。
+    最常见写法的位置不收集，其 `CiPosting` 列表为空。原文和译文字数不符的小节不计入。
+    """
+    if by not in ("lat", "han"):
+        raise ValueError(f"by 只能是 'lat' 或 'han': {by}")
+    if sort not in ("entropy", "minority"):
+        raise ValueError(f"sort 只能是 'entropy' 或 'minority': {sort}")
+    with _stage("find_variants", by):
+        counter = Counter()
+        for (_, _, _, tokens) in _aligned_verses(books):
+            counter.update(zip(tokens.lat_ci, tokens.han_ci))
+        by_key = {}
+        for ((lat, han), count) in counter.items():
+            (key, text) = (lat, han) if by == "lat" else (han, lat)
+            by_key.setdefault(key, []).append((text, count))
+        groups = []
+        minority = {}   # {(lat, han): [CiPosting, ...]}
+        for (key, variants) in by_key.items():
+            total = sum(count for (_, count) in variants)
+            if len(variants) < 2 or total < min_count:
+                continue
+            variants.sort(key=lambda item: (-item[1], item[0]))
+            entropy = -sum(count / total * math.log2(count / total) for (_, count) in variants)
+            with_braces = sum(1 for (text, _) in variants if "{" in text)
+            ranked = []
+            for i, (text, count) in enumerate(variants):
+                postings = []
+                if i > 0:
+                    minority[(key, text) if by == "lat" else (text, key)] = postings
+                ranked.append((text, count, postings))
+            groups.append(VariantGroup(key, total, entropy, 1 - variants[0][1] / total,
+                                       0 < with_braces < len(variants), ranked))
+        for (book_no, chapter_no, verse_no, tokens) in _aligned_verses(books):
+            spans = None
+            for i, pair in enumerate(zip(tokens.lat_ci, tokens.han_ci)):
+                postings = minority.get(pair)
+                if postings is None:
+                    continue
+                if spans is None:
+                    (_, _, lat_spans, han_spans) = spans = tokens.spans()
+                postings.append(CiPosting(book_no, chapter_no, verse_no, *pair,
+                                          (lat_spans[2*i], lat_spans[2*i+1]),
+                                          (han_spans[2*i], han_spans[2*i+1])))
+    if sort == "entropy":
+        groups.sort(key=lambda g: (-g.entropy, -g.total, g.key))
+    else:
+        groups.sort(key=lambda g: (-g.minority_share, -g.total, g.key))
+    return groups
+
+def _aligned_verses(books: Books):
+    """以生成器方式返回原文和译文字数相符的各小节: (book_no, chapter_no, verse_no, VerseTokens)。"""
+    for book_no, book in enumerate(books, 1):
+        for chapter_no, chapter in enumerate(book.chapters, 1):
+            for verse_no, verse in enumerate(chapter.verses):
+                tokens = verse.tokens()
+                if len(tokens.lat_zi) == len(tokens.han_zi):
+                    yield (book_no, chapter_no, verse_no, tokens)
+
+def write_variants_report(books: Books, path: str, by: str="lat", min_count: int=2,
+                          sort: str="entropy", width: int=30) -> int:
+    """把 `find_variants()` 的结果写成 Markdown 报告，返回列出的组数。
+
+    每组列出各写法的次数和比例；最常见写法以外的各写法，逐条列出所在的书、章节、行号和上下文。
+    """
+    groups = find_variants(books, by, min_count, sort)
+    tmp_path = f"{path}.tmp"
+    with _stage("write_variants_report"), open(tmp_path, "w", encoding="utf-8") as f:
+        title = "罗马字词的汉字写法" if by == "lat" else "汉字词的罗马字拼法"
+        f.write(f"# 一致性报告：{title}\n\n")
+        f.write(f"共 {len(groups)} 个词有多种写法（出现至少 {min_count} 次），"
+                f"按{'熵' if sort == 'entropy' else '少数写法比例'}排列。🟡 表示 {{…}} 用法不统一。\n")
+        for group in groups:
+            mark = " 🟡" if group.placeholder_mixed else ""
+            f.write(f"\n## {group.key}{mark}\n\n"
+                    f"共 {group.total} 次，{len(group.variants)} 种写法，"
+                    f"熵 {group.entropy:.2f}，少数写法占 {group.minority_share:.0%}。\n\n"
+                    "| 写法 | 次数 | 比例 |\n| ---- | ---: | ---: |\n")
+            for (text, count, _) in group.variants:
+                f.write(f"| {text} | {count} | {count / group.total:.0%} |\n")
+            for (text, count, postings) in group.variants[1:]:
+                f.write(f"\n**{text}**：\n\n")
+                for p in postings:
+                    verse = books[p.book_no-1].chapters[p.chapter_no-1].verses[p.verse_no]
+                    (lat_left, lat_word, lat_right) = _kwic_context(verse.lat, p.lat_span, width, " ")
+                    (han_left, han_word, han_right) = _kwic_context(verse.han, p.han_span, max(1, width // 3))
+                    f.write(f"- {books[p.book_no-1].book_name.han} {p.chapter_no}.{p.verse_no}"
+                            f"（第 {verse.line_no} 行）：{lat_left}**{lat_word}**{lat_right}"
+                            f" ｜ {han_left}**{han_word}**{han_right}\n")
+    os.replace(tmp_path, path)
+    return len(groups)
+
+
+class Unit(NamedTuple):
+    """语料中一个对齐的单位（一个小节、一行诗或一个词条），由 `iter_units()` 生成。"""
+    corpus: str         # 语法名，见 `GRAMMARS`
+    path: str
+    line_no: int        # 原文行的行号
+    where: tuple        # 所在位置，如 (书名, 章标题, 节号)，各语料不同
+    lat: str|None       # 原文（罗马字或注音），没有时为 `None`
+    han: str|None       # 汉字
+
+
+class Grammar(abc.ABC):
+    """一种语料格式的语法。子类实现 `detect()` 和 `parse()`，需要时重写 `tokens()`，
+    再用 `register_grammar()` 注册，`iter_units()` 就能自动识别该格式的文件。
+    缺少 `detect()` 或 `parse()` 的子类在创建实例时就会报 TypeError。"""
+
+    name = ""
+
+    @abc.abstractmethod
+    def detect(self, path: str) -> bool:
+        """根据（绝对）路径判断文件是否属于该语料。"""
+
+    @abc.abstractmethod
+    def parse(self, path: str, lines):
+        """`lines` 是 `iter_lines(path)` 的结果，以生成器方式返回 `Unit`。"""
+
+    def tokens(self, unit: Unit) -> tuple[tuple, tuple, tuple, tuple]:
+        """分字、分词，返回 (lat_zi, han_zi, lat_ci, han_ci)。默认与 `Verse.tokens()` 相同。"""
+        tokens = VerseTokens(unit.lat, unit.han)
+        return (tokens.lat_zi, tokens.han_zi, tokens.lat_ci, tokens.han_ci)
+
+
+GRAMMARS: dict[str, Grammar] = {}
+
+def register_grammar(grammar: Grammar) -> Grammar:
+    """注册一种语法，同名的会被替换。"""
+    GRAMMARS[grammar.name] = grammar
+    return grammar
+
+def detect_grammar(path: str) -> Grammar|None:
+    for grammar in GRAMMARS.values():
+        if grammar.detect(str(pathlib.Path(path).resolve())):
+            return grammar
+    return None
+
+
+class NewTestamentGrammar(Grammar):
+    """台州羅馬字聖經《新約》1897版：`# ` 书名、`## ` 章、`·` 小节、`**_` 概述，
+    下一个 `> ` 行是译文。与 `load_trans_books()` 的结果一致，但不整本载入。"""
+
+    name = "新約1897"
+
+    def detect(self, path: str) -> bool:
+        return "新約" in path and "漢字對照" in path
+
+    def parse(self, path: str, lines):
+        book = chapter = None
+        pending = None  # (行号, 位置, 原文)，等待译文行
+        for (no, line, line_info) in lines:
+            type = line_info.type
+            if type == LineInfo.BOOK:
+                book = line_info.content
+                pending = (no, (book, None, None), book)
+            elif type == LineInfo.CHAPTER:
+                chapter = line_info.content
+                pending = None
+            elif type == LineInfo.VERSE or type == LineInfo.PREV:
+                verse = (_line_key(line_info) or "0") if type == LineInfo.VERSE else "0"
+                pending = (no, (book, chapter, verse), line.strip())
+            elif (type == LineInfo.TRANS or type == LineInfo.TRANS_PREV) and pending is not None:
+                (line_no, where, lat) = pending
+                # 书名只保存内容，小节保留原格式，与 `Book` 相同
+                han = line_info.content if where[1] is None else line.strip()
+                yield Unit(self.name, path, line_no, where, lat, han)
+                pending = None
+
+
+class HymnalGrammar(Grammar):
+    """台州羅馬字《讚美詩》1880版：`## n` 为第 n 首，`**n**` 为第 n 节，
+    其后若干 `> ` 罗马字行，再接同样行数的 `- ` 汉字行，按顺序逐行对应。
+
+    原文的送气符号用 `‛`，分字前换成与新约相同的 `'`。
+    """
+
+    name = "讚美詩1880"
+
+    def detect(self, path: str) -> bool:
+        return "讚美詩" in path and pathlib.Path(path).name.startswith("1、")
+
+    def parse(self, path: str, lines):
+        hymn = stanza = None
+        lat_lines = []      # [(行号, 罗马字), ...]，本节尚未对应的罗马字行
+        han_index = 0
+        for (no, line, _) in lines:
+            text = line.strip()
+            if text.startswith("## "):
+                (hymn, stanza, lat_lines) = (text[3:], None, [])
+            elif (match := HymnalGrammar._re_stanza.match(text)):
+                (stanza, lat_lines, han_index) = (match.group(1), [], 0)
+            elif text.startswith("> ") and stanza is not None:
+                lat_lines.append((no, text[2:].strip()))
+            elif text.startswith("- ") and han_index < len(lat_lines):
+                (line_no, lat) = lat_lines[han_index]
+                yield Unit(self.name, path, line_no, (hymn, stanza, han_index + 1), lat, text[2:].strip())
+                han_index += 1
+
+    _re_stanza = re.compile(r"\*\*(\d+)\*\*$")
+
+    def tokens(self, unit: Unit) -> tuple[tuple, tuple, tuple, tuple]:
+        tokens = VerseTokens(unit.lat.replace("‛", "'"), unit.han)
+        return (tokens.lat_zi, tokens.han_zi, tokens.lat_ci, tokens.han_ci)
+
+
+class GazetteerGrammar(Grammar):
+    """民國《黃巖縣新志稿》卷五-方言。
+
+    第二章的词条如 `天暡曚（ㄊㄧㄝ ㄥ ㄇㄥ），…`：汉字词与注音按音节对应，注音以空格分隔。
+    第一章的词条如 `…曰「天亮奣〔讀若猛平聲〕」`：只有汉字，`lat` 为 `None`。
+    `where` 为 (章, 节, 小类)。
+    """
+
+    name = "黃巖縣新志稿-方言"
+
+    def detect(self, path: str) -> bool:
+        return "黃巖縣新志稿" in path
+
+    _re_entry = re.compile(r"([^（(，,、\s]+)（([^）]*)）")
+    _re_term = re.compile(r"「([^」]+)」")
+    _re_han = re.compile(r"\{.+?\}|[㐀-䶿一-鿿豈-﫿\U00020000-\U000323AF☐]")
+    _re_inline_note = re.compile(r"〔.*?〕|【|】")
+
+    def parse(self, path: str, lines):
+        where = [None, None, None]
+        for (no, line, _) in lines:
+            text = line.strip()
+            if text.startswith("#"):
+                level = len(text) - len(text.lstrip("#"))
+                if 1 <= level <= 3:
+                    where[level-1:] = [text[level:].strip().rstrip("，,")] + [None] * (3 - level)
+                continue
+            if not text or text.startswith(">"):
+                continue
+            if (match := GazetteerGrammar._re_entry.match(text)):
+                lat = match.group(2).strip() or None    # 部分词条未注音
+                yield Unit(self.name, path, no, tuple(where), lat, match.group(1))
+            else:
+                for term in GazetteerGrammar._re_term.findall(text):
+                    term = GazetteerGrammar._re_inline_note.sub("", term)
+                    yield Unit(self.name, path, no, tuple(where), None, term)
+
+    def tokens(self, unit: Unit) -> tuple[tuple, tuple, tuple, tuple]:
+        lat_zi = tuple(unit.lat.split()) if unit.lat else ()
+        han_zi = tuple(GazetteerGrammar._re_han.findall(unit.han))
+        # 一个词条即一个分词
+        lat_ci = (" ".join(lat_zi),) if lat_zi else ()
+        han_ci = ("".join(han_zi),) if lat_zi else ()
+        return (lat_zi, han_zi, lat_ci, han_ci)
+
+
+register_grammar(NewTestamentGrammar())
+register_grammar(HymnalGrammar())
+register_grammar(GazetteerGrammar())
+
+
+def iter_units(*paths: str, grammar: "str|Grammar"=None):
+    """逐个文件、逐行解析，以生成器方式返回 `Unit`，不会把整个语料载入内存。
+
+    `grammar`: 可选，语法名或 `Grammar` 对象；不给出时根据路径自动识别，
+    无法识别的文件会输出提示并跳过。
+    """
+    if isinstance(grammar, str):
+        grammar = GRAMMARS[grammar]
+    for path in paths:
+        file_grammar = grammar if grammar is not None else detect_grammar(path)
+        if file_grammar is None:
+            print(f"🟡 无法识别语料格式，已跳过: {path}")
+            continue
+        with _stage("iter_units", str(path)):
+            yield from file_grammar.parse(str(path), iter_lines(path))
+
+def iter_aligned(units, zi: bool=False, mismatches: list=None):
+    """对每个单位分字或分词，以生成器方式返回 (unit, lat_items, han_items)。
+
+    没有原文的单位跳过；原文和译文字数不符的单位跳过，给出 `mismatches` 列表时加进该列表。
+    """
+    for unit in units:
+        if not unit.lat or not unit.han:
+            continue
+        (lat_zi, han_zi, lat_ci, han_ci) = GRAMMARS[unit.corpus].tokens(unit)
+        if len(lat_zi) != len(han_zi):
+            if mismatches is not None:
+                mismatches.append(unit)
+            continue
+        yield (unit, lat_zi, han_zi) if zi else (unit, lat_ci, han_ci)
+
+def units_fenci(units, zi: bool=False, mismatches: list=None) -> Counter:
+    """对 `iter_units()` 的结果做分词或分字统计，格式同 `books.fenci()`。 {(lat, han): count}
+
+    可以混合多个语料，例如
+    `units_fenci(iter_units(*新约路径, *讚美詩路径), zi=True)`；
+    结果可直接传给 `Lat2Han`、`Han2Lat`。
+    """
+    counter = Counter()
+    for (_, lat_items, han_items) in iter_aligned(units, zi, mismatches):
+        counter.update(zip(lat_items, han_items))
+    return counter
+
+def search_units(units, lat: str=None, han: str=None, zi: bool=True):
+    """在语料中顺序查找包含连续分字（`zi=False` 时为分词）的单位，以生成器方式返回 (unit, 位置)。
+
+    不需要建立索引，适合在 `Books` 之外的语料中临时查找。
+    """
+    q_lat = tuple(Books._re_lat_zi.findall(lat.lower())) if lat is not None else None
+    q_han = tuple(Books._re_han_zi.findall(han)) if han is not None else None
+    if q_lat is None and q_han is None:
+        raise TypeError("lat 和 han 至少需要给出一个。")
+    size = len(q_lat if q_lat is not None else q_han)
+    for (unit, lat_items, han_items) in iter_aligned(units, zi):
+        lat_items = tuple(item.lower() for item in lat_items)
+        for pos in range(len(lat_items) - size + 1):
+            if (q_lat is None or lat_items[pos:pos+size] == q_lat) \
+                    and (q_han is None or han_items[pos:pos+size] == q_han):
+                yield (unit, pos)
+
+
+class CorpusDB:
+    """把 books 导出到 SQLite 数据库，并提供简单的查询。原文和译文分别建有 FTS5 全文索引。
+
+    使用方式:
+        ```
+        db = CorpusDB("corpus.sqlite")
+        db.export(books)                    # 只重写内容有改动的书
+        db.search(lat="Yia-su Kyi-toh")     # 全文检索，返回 sqlite3.Row 列表
+        db.search(han="耶穌")
+        db.translations("pi-kao")           # {han: count}
+        db.fenci(zi=True)                   # 同 books.fenci()，但直接在数据库中统计
+        db.execute("SELECT ...")            # 其他查询
+        db.close()
+        ```
+    ---
+    主要的表：
+        books(book_no, path, name_lat, name_han, digest)
+        chapters(book_no, chapter_no, line_no, title)
+        verses(id, book_no, chapter_no, verse_no, line_no, lat, han)
+        footnotes(book_no, seq, text)
+        ci_pairs / zi_pairs(verse_id, pos, lat, han, lat_start, lat_end, han_start, han_end)
+        verses_lat_fts(lat)、verses_han_fts(han)：以 verses 为内容的全文索引，rowid 即 verses.id
+    `verses.id` 由 书、章、节 编号合成，见 `CorpusDB.verse_id()`。书名也存为一个小节，其章、节编号都是 0。
+    分词、分字表只收录原文和译文字数相符的小节，与 `books.fenci()` 一致。
+    """
+
+    SCHEMA_VERSION = 1
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value TEXT);
+    CREATE TABLE IF NOT EXISTS books(
+        book_no INTEGER PRIMARY KEY, path TEXT, name_lat TEXT, name_han TEXT, digest TEXT);
+    CREATE TABLE IF NOT EXISTS chapters(
+        book_no INTEGER, chapter_no INTEGER, line_no INTEGER, title TEXT,
+        PRIMARY KEY(book_no, chapter_no));
+    CREATE TABLE IF NOT EXISTS verses(
+        id INTEGER PRIMARY KEY, book_no INTEGER, chapter_no INTEGER, verse_no INTEGER,
+        line_no INTEGER, lat TEXT, han TEXT);
+    CREATE INDEX IF NOT EXISTS verses_book ON verses(book_no);
+    CREATE TABLE IF NOT EXISTS footnotes(book_no INTEGER, seq INTEGER, text TEXT);
+    CREATE INDEX IF NOT EXISTS footnotes_book ON footnotes(book_no);
+    CREATE TABLE IF NOT EXISTS ci_pairs(
+        verse_id INTEGER, pos INTEGER, lat TEXT, han TEXT,
+        lat_start INTEGER, lat_end INTEGER, han_start INTEGER, han_end INTEGER,
+        PRIMARY KEY(verse_id, pos)) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS ci_pairs_lat ON ci_pairs(lat, han);
+    CREATE INDEX IF NOT EXISTS ci_pairs_han ON ci_pairs(han, lat);
+    CREATE TABLE IF NOT EXISTS zi_pairs(
+        verse_id INTEGER, pos INTEGER, lat TEXT, han TEXT,
+        lat_start INTEGER, lat_end INTEGER, han_start INTEGER, han_end INTEGER,
+        PRIMARY KEY(verse_id, pos)) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS zi_pairs_lat ON zi_pairs(lat, han);
+    CREATE INDEX IF NOT EXISTS zi_pairs_han ON zi_pairs(han, lat);
+    CREATE VIRTUAL TABLE IF NOT EXISTS verses_lat_fts USING fts5(
+        lat, content="verses", content_rowid="id", tokenize="unicode61 remove_diacritics 0");
+    CREATE VIRTUAL TABLE IF NOT EXISTS verses_han_fts USING fts5(
+        han, content="verses", content_rowid="id", tokenize="trigram");
+    """
+    _TABLES = frozenset(re.findall(r"CREATE (?:VIRTUAL )?TABLE IF NOT EXISTS (\w+)", _SCHEMA))
+    _MARK = ("creator", "tool.py CorpusDB")  # 写在 meta 表中，表示数据库由本类创建
+
+    def __init__(self, path: str) -> None:
+        import sqlite3
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        try:
+            tables = {row[0] for row in self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")}
+        except sqlite3.DatabaseError:     # 不是 SQLite 文件
+            self.conn.close()
+            raise
+        if tables:
+            if not self._created_here(tables):
+                self.conn.close()
+                raise ValueError(f"{path} 不是 CorpusDB 创建的数据库，不会改动它，请换一个路径。")
+            row = self.conn.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+            version = row[0] if row else None
+            if version != str(CorpusDB.SCHEMA_VERSION):
+                # 格式改变时整个重建，数据都可以从 books 重新导出
+                print(f"🟡 {path} 是旧格式（版本 {version}）的 CorpusDB 数据库，将删除后重建，"
+                      "请重新调用 `export()` 导出数据。")
+                self.conn.close()
+                os.remove(path)
+                self.conn = sqlite3.connect(path)
+                self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.executescript(CorpusDB._SCHEMA)
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES('version', ?)",
+                              (str(CorpusDB.SCHEMA_VERSION),))
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES(?, ?)", CorpusDB._MARK)
+
+    def _created_here(self, tables: set[str]) -> bool:
+        """数据库是否由本类创建。只有这样的数据库才会在格式改变时被删除重建。"""
+        if "meta" not in tables:
+            return False
+        if self.conn.execute("SELECT 1 FROM meta WHERE key=? AND value=?", CorpusDB._MARK).fetchone():
+            return True
+        # 加上标记之前创建的数据库：只含本类的表（及全文索引自带的表）
+        return all(name in CorpusDB._TABLES or name.startswith(("verses_lat_fts_", "verses_han_fts_"))
+                   for name in tables)
+
+    def __enter__(self) -> "CorpusDB":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def verse_id(book_no: int, chapter_no: int, verse_no: int) -> int:
+        """由 书、章、节 编号合成 `verses.id`。"""
+        return (book_no * 1000 + chapter_no) * 1000 + verse_no
+
+    def _book_digest(book: Book) -> str:
+        """书的内容摘要，用于判断是否需要重新导出。与 `hash()` 不同，每次运行结果相同。"""
+        digest = hashlib.sha1()
+        for verse in itertools.chain((book.book_name,),
+                                     (v for chapter in book.chapters for v in chapter.verses)):
+            digest.update(f"{verse.line_no}\0{verse.lat}\0{verse.han}\0".encode("utf-8"))
+        for chapter in book.chapters:
+            digest.update(f"{chapter.line_no}\0{chapter.title}\0".encode("utf-8"))
+        for footnote in book.footnotes:
+            digest.update(footnote.encode("utf-8") + b"\0")
+        return digest.hexdigest()
+
+    @_profiled("CorpusDB.export")
+    def export(self, books: Books, force: bool=False) -> int:
+        """导出全部书。内容未变的书跳过，除非 `force`；多出的旧书会被删除。
+
+        返回重新导出的书的数量。
+        """
+        updated = 0
+        for book_no, book in enumerate(books, 1):
+            if self.update_book(book_no, book, force):
+                updated += 1
+        with self.conn:
+            for row in self.conn.execute("SELECT book_no FROM books WHERE book_no > ?",
+                                         (len(books),)).fetchall():
+                self._delete_book(row[0])
+        return updated
+
+    def update_book(self, book_no: int, book: Book, force: bool=False) -> bool:
+        """只重写第 `book_no` 本书（从 1 开始）。内容未变时跳过并返回 `False`。"""
+        digest = CorpusDB._book_digest(book)
+        row = self.conn.execute("SELECT digest FROM books WHERE book_no=?", (book_no,)).fetchone()
+        if not force and row is not None and row[0] == digest:
+            _count("cache.db.hit")
+            return False
+        _count("cache.db.miss")
+        with _stage("CorpusDB.export", book.path), self.conn:    # 一本书在一个事务中完成
+            self._delete_book(book_no)
+            self._insert_book(book_no, book, digest)
+        return True
+
+    def _delete_book(self, book_no: int) -> None:
+        lo = CorpusDB.verse_id(book_no, 0, 0)
+        hi = CorpusDB.verse_id(book_no + 1, 0, 0)
+        execute = self.conn.execute
+        execute("DELETE FROM books WHERE book_no=?", (book_no,))
+        execute("DELETE FROM chapters WHERE book_no=?", (book_no,))
+        execute("DELETE FROM footnotes WHERE book_no=?", (book_no,))
+        # 外部内容的全文索引须用原来的文本删除，所以要在删除 verses 之前
+        for (table, column) in (("verses_lat_fts", "lat"), ("verses_han_fts", "han")):
+            execute(f"INSERT INTO {table}({table}, rowid, {column}) "
+                    f"SELECT 'delete', id, {column} FROM verses WHERE book_no=?", (book_no,))
+        for table in ("ci_pairs", "zi_pairs"):
+            execute(f"DELETE FROM {table} WHERE verse_id >= ? AND verse_id < ?", (lo, hi))
+        execute("DELETE FROM verses WHERE book_no=?", (book_no,))
+
+    def _insert_book(self, book_no: int, book: Book, digest: str) -> None:
+        executemany = self.conn.executemany
+        name = book.book_name
+        self.conn.execute("INSERT INTO books VALUES(?, ?, ?, ?, ?)",
+                          (book_no, str(book.path), name.lat, name.han, digest))
+        executemany("INSERT INTO chapters VALUES(?, ?, ?, ?)",
+                    [(book_no, chapter_no, chapter.line_no, chapter.title)
+                     for chapter_no, chapter in enumerate(book.chapters, 1)])
+        executemany("INSERT INTO footnotes VALUES(?, ?, ?)",
+                    [(book_no, seq, text) for seq, text in enumerate(book.footnotes, 1)])
+        verses = []
+        ci_pairs = []
+        zi_pairs = []
+        numbered = [(0, 0, name)]
+        numbered.extend((chapter_no, verse_no, verse)
+                        for chapter_no, chapter in enumerate(book.chapters, 1)
+                        for verse_no, verse in enumerate(chapter.verses))
+        for (chapter_no, verse_no, verse) in numbered:
+            verse_id = CorpusDB.verse_id(book_no, chapter_no, verse_no)
+            verses.append((verse_id, book_no, chapter_no, verse_no, verse.line_no, verse.lat, verse.han))
+            tokens = verse.tokens()
+            (lat_zi_spans, han_zi_spans, lat_ci_spans, han_ci_spans) = tokens.spans()
+            if han_ci_spans is None:    # 字数不符
+                continue
+            for (pairs, lat, han, lat_spans, han_spans) in (
+                    (zi_pairs, tokens.lat_zi, tokens.han_zi, lat_zi_spans, han_zi_spans),
+                    (ci_pairs, tokens.lat_ci, tokens.han_ci, lat_ci_spans, han_ci_spans)):
+                for pos in range(len(lat)):
+                    pairs.append((verse_id, pos, lat[pos], han[pos],
+                                  lat_spans[2*pos], lat_spans[2*pos+1],
+                                  han_spans[2*pos], han_spans[2*pos+1]))
+        executemany("INSERT INTO verses VALUES(?, ?, ?, ?, ?, ?, ?)", verses)
+        executemany("INSERT INTO verses_lat_fts(rowid, lat) VALUES(?, ?)", [(v[0], v[5]) for v in verses])
+        executemany("INSERT INTO verses_han_fts(rowid, han) VALUES(?, ?)", [(v[0], v[6]) for v in verses])
+        executemany("INSERT INTO ci_pairs VALUES(?, ?, ?, ?, ?, ?, ?, ?)", ci_pairs)
+        executemany("INSERT INTO zi_pairs VALUES(?, ?, ?, ?, ?, ?, ?, ?)", zi_pairs)
+
+    # 查询
+
+    def execute(self, sql: str, params=()) -> list:
+        """执行任意 SQL，返回全部结果。"""
+        return self.conn.execute(sql, params).fetchall()
+
+    def _phrase(text: str) -> str:
+        """把输入作为 FTS5 的短语查询，避免 `-`、`'` 等被当作查询语法。"""
+        return '"' + text.replace('"', '""') + '"'
+
+    def search(self, lat: str=None, han: str=None, limit: int=100, raw: bool=False) -> list:
+        """全文检索小节。`lat`、`han` 同时给出时取交集，结果按书、章、节排列。
+
+        默认把输入当作一个短语；`raw=True` 时直接使用 FTS5 的查询语法。
+        汉字用 trigram 索引，不足 3 个字时改用 LIKE 查找。
+        返回 sqlite3.Row 列表，字段同 `verses` 表。
+        """
+        conditions = []
+        params = []
+        if lat is not None:
+            conditions.append("id IN (SELECT rowid FROM verses_lat_fts WHERE verses_lat_fts MATCH ?)")
+            params.append(lat if raw else CorpusDB._phrase(lat))
+        if han is not None:
+            if raw or len(han) >= 3:
+                conditions.append("id IN (SELECT rowid FROM verses_han_fts WHERE verses_han_fts MATCH ?)")
+                params.append(han if raw else CorpusDB._phrase(han))
+            else:
+                conditions.append("han LIKE ? ESCAPE '\\'")
+                params.append("%" + re.sub(r"([%_\\])", r"\\\1", han) + "%")
+        if not conditions:
+            raise TypeError("lat 和 han 至少需要给出一个。")
+        sql = f"SELECT * FROM verses WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?"
+        return self.execute(sql, (*params, limit))
+
+    def get_verse(self, book_no: int, chapter_no: int, verse_no: int):
+        """获取一个小节，编号同 `Books.get_verse()`。找不到时返回 `None`。"""
+        return self.conn.execute("SELECT * FROM verses WHERE id=?",
+                                 (CorpusDB.verse_id(book_no, chapter_no, verse_no),)).fetchone()
+
+    def translations(self, lat_ci: str) -> Counter:
+        """某罗马字词的全部汉字写法。 {han: count}"""
+        rows = self.execute("SELECT han, COUNT(*) FROM ci_pairs WHERE lat=? GROUP BY han",
+                            (lat_ci.lower(),))
+        return Counter(dict(rows))
+
+    def readings(self, han_zi: str) -> Counter:
+        """某汉字的全部读音。 {lat: count}"""
+        rows = self.execute("SELECT lat, COUNT(*) FROM zi_pairs WHERE han=? GROUP BY lat", (han_zi,))
+        return Counter(dict(rows))
+
+    def fenci(self, zi: bool=False) -> Counter:
+        """分词或分字统计，结果同 `books.fenci(mismatches=[])`。 {(lat, han): count}"""
+        table = "zi_pairs" if zi else "ci_pairs"
+        rows = self.execute(f"SELECT lat, han, COUNT(*) FROM {table} GROUP BY lat, han")
+        return Counter({(lat, han): count for (lat, han, count) in rows})
+
+
+class Watcher:
+    """监视原文和译文文件，文件保存后只处理改动过的行。
+
+    - 原文文件：只对改动的行重新检查标点。
+    - 译文文件：同样检查改动行的标点。若改动的只是小节、书名或章标题的内容，
+      直接修改 `books` 中对应的对象；否则只重新解析这一本书。
+      之后只更新这本书在各索引中的记录，并检查改动小节的字数是否相符。
+      分词统计会在下次调用 `books.fenci()` 时只重新统计这本书。
+
+    只用标准库轮询文件的修改时间，不依赖其他服务。
+
+    使用方式:
+        `watcher = Watcher(books, origin_paths=[...])`
+        `watcher.run()`                         # 一直运行，Ctrl+C 结束
+        `watcher.start()` 和 `watcher.stop()`   # 在后台线程中运行，适合 notebook
+    """
+
+    def __init__(self, books: Books=None, origin_paths=(), interval: float=1.0) -> None:
+        self.books = books if books is not None else Books()
+        self.interval = interval
+        self._files = {}        # {path: (修改时间和大小, 各行内容)}
+        self._trans_paths = {}  # {path: book 对象}，用于找到对应的书
+        self._thread = None
+        self._stop_event = threading.Event()
+        for path in origin_paths:
+            self._files[path] = Watcher._snapshot(path)
+        for book in self.books:
+            if book.path is not None:
+                self._files[book.path] = Watcher._snapshot(book.path)
+                self._trans_paths[book.path] = book
+
+    def _snapshot(path: str) -> tuple:
+        stat = os.stat(path)
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().split("\n")
+        return ((stat.st_mtime_ns, stat.st_size), lines)
+
+    def poll(self) -> list[str]:
+        """检查一次所有文件，处理改动过的文件，返回这些文件的路径。"""
+        changed = []
+        for path, (key, old_lines) in list(self._files.items()):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue    # 编辑器保存时可能短暂不存在
+            if (stat.st_mtime_ns, stat.st_size) == key:
+                continue
+            snapshot = Watcher._snapshot(path)
+            self._files[path] = snapshot
+            new_lines = snapshot[1]
+            opcodes = Watcher._diff(old_lines, new_lines)
+            if not opcodes:
+                continue
+            changed.append(path)
+            ranges = [(j1+1, j2) for (_, _, _, j1, j2) in opcodes if j2 > j1]
+            shown = ", ".join(f"{a}" if a == b else f"{a}-{b}" for (a, b) in ranges) or "删除"
+            print(f"🔵 {path}: 行 {shown} 有改动")
+            for (a, b) in ranges:
+                for no in range(a, b+1):
+                    for (column, rule, message) in _check_punc_line(new_lines[no-1].strip()):
+                        print("    " + PuncDiagnostic(path, no, column, rule, message).format())
+            if path in self._trans_paths:
+                self._update_trans(path, old_lines, new_lines, opcodes)
+        return changed
+
+    def _diff(old_lines: list[str], new_lines: list[str]) -> list[tuple]:
+        """比较前后两个版本，返回不相同部分的 opcodes（下标从 0 开始）。
+
+        先去掉相同的开头和结尾，一般只剩下很少几行，再交给 `difflib`。
+        """
+        start = 0
+        limit = min(len(old_lines), len(new_lines))
+        while start < limit and old_lines[start] == new_lines[start]:
+            start += 1
+        end = 0
+        while end < limit - start and old_lines[-1-end] == new_lines[-1-end]:
+            end += 1
+        old_mid = old_lines[start:len(old_lines)-end]
+        new_mid = new_lines[start:len(new_lines)-end]
+        if not old_mid and not new_mid:
+            return []
+        matcher = difflib.SequenceMatcher(None, old_mid, new_mid, autojunk=False)
+        return [(tag, i1+start, i2+start, j1+start, j2+start)
+                for (tag, i1, i2, j1, j2) in matcher.get_opcodes() if tag != "equal"]
+
+    def _update_trans(self, path: str, old_lines: list[str], new_lines: list[str], opcodes: list[tuple]) -> None:
+        """把译文文件的改动同步到 `books`。"""
+        book = self._trans_paths[path]
+        book_no = next((no for no, b in enumerate(self.books, 1) if b is book), None)
+        if book_no is None:
+            return
+        verses = Watcher._patch_lines(book, new_lines, opcodes)
+        if verses is None:  # 无法直接修改，重新解析这本书
+            new_book = _load_trans_book(path)
+            if new_book is None:
+                print("    🔴 解析失败，保留修改前的内容。")
+                return
+            self.books.update_book(book_no, new_book)
+            self._trans_paths[path] = new_book
+            print(f"    已重新载入《{new_book.book_name.han}》")
+            return
+        self.books.update_book(book_no)
+        for verse in verses:
+            (list_lat_zi, list_han_zi) = Books._verse_fenzi(verse)
+            if len(list_lat_zi) != len(list_han_zi):
+                print(f"    🔴 行-{verse.line_no}: 翻译字数与原文不符："
+                      f"lat: {len(list_lat_zi)}, han: {len(list_han_zi)}")
+
+    def _patch_lines(book: Book, new_lines: list[str], opcodes: list[tuple]) -> list[Verse]|None:
+        """尝试直接修改 `book` 中对应的对象。
+
+        只处理行数不变、且改动的行都是 书名、章标题、小节 的原文或译文的情况，
+        返回改动过的小节；其他情况返回 `None`，表示需要重新解析。
+        """
+        # {行号: (对象, 属性, 该行应有的类型)}
+        targets = {}
+        name = book.book_name
+        targets[name.line_no] = (name, 'lat', LineInfo.BOOK)
+        targets[name.line_no+2] = (name, 'han', LineInfo.TRANS)
+        for chapter in book.chapters:
+            targets[chapter.line_no] = (chapter, 'title', LineInfo.CHAPTER)
+            targets[chapter.line_no+2] = (None, None, LineInfo.TRANS)   # 章标题的译文未保存
+            for verse in chapter.verses:
+                line_type = LineInfo(verse.lat).type
+                han_type = LineInfo.TRANS_PREV if line_type == LineInfo.PREV else LineInfo.TRANS
+                targets[verse.line_no] = (verse, 'lat', line_type)
+                targets[verse.line_no+2] = (verse, 'han', han_type)
+        changes = []
+        for (tag, i1, i2, j1, j2) in opcodes:
+            if tag != "replace" or i2 - i1 != j2 - j1:
+                return None
+            for index in range(j1, j2):
+                target = targets.get(index+1)
+                line = new_lines[index].strip()
+                line_info = LineInfo(line)
+                if target is None or line_info.type != target[2]:
+                    return None
+                changes.append((target, line, line_info))
+        verses = []
+        for ((obj, attr, line_type), line, line_info) in changes:
+            if obj is None:
+                continue
+            if isinstance(obj, Verse) and obj is not book.book_name:
+                setattr(obj, attr, line)    # 小节保留原格式
+                if obj not in verses:
+                    verses.append(obj)
+            else:
+                setattr(obj, attr, line_info.content)
+        return verses
+
+    def run(self) -> None:
+        """一直轮询，直到按 Ctrl+C 或调用 `stop()`。"""
+        print(f"开始监视 {len(self._files)} 个文件，按 Ctrl+C 结束。")
+        try:
+            while not self._stop_event.is_set():
+                self.poll()
+                self._stop_event.wait(self.interval)
+        except KeyboardInterrupt:
+            pass
+
+    def start(self) -> None:
+        """在后台线程中运行。"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止后台线程。"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class ServiceError(RuntimeError):
+    """查询服务的请求错误。`status` 是对应的 HTTP 状态码：
+    404 没有这个接口或找不到要查的内容，400 参数缺失或有误。"""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class CorpusService:
+    """常驻内存的语料查询服务，供 `CorpusServer` 使用，也可以直接调用 `call()`。
+
+    books、分词统计、索引和 `Lat2Han`/`Han2Lat` 在第一次用到后一直保留，
+    每次请求前用 `Watcher` 检查一次文件，有改动时只更新改动的书。
+
+    各请求在同一把锁中执行：查询都是纯 Python 计算，受 GIL 限制本来就无法并行，
+    加锁可以避免在更新某本书的中途读到不完整的索引。
+    """
+
+    def __init__(self, books: Books, fenci: "Counter|str"=None, origin_paths=()) -> None:
+        self.books = books
+        self.watcher = Watcher(books, origin_paths)
+        self._fenci = fenci         # 分词统计或 fenci.csv 的路径；不给出时使用 books.fenci()
+        self._lat2han = None
+        self._han2lat = None
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.requests = Counter()
+
+    def call(self, endpoint: str, params: dict):
+        """处理一次请求，返回可序列化为 JSON 的结果。
+
+        没有这个接口、参数有误或找不到要查的内容时抛出 `ServiceError`，其他异常是服务本身的问题。
+        """
+        method = getattr(self, f"_api_{endpoint}", None)
+        if method is None:
+            raise ServiceError(404, f"没有这个接口: {endpoint}")
+        try:
+            inspect.signature(method).bind(**params)
+        except TypeError as e:
+            raise ServiceError(400, f"参数有误: {e}") from None
+        with self._lock:
+            if self.watcher.poll():
+                # 分词统计按书缓存，只需重建转换表
+                self._lat2han = self._han2lat = None
+            self.requests[endpoint] += 1
+            with _stage("serve", endpoint):
+                return method(**params)
+
+    def warm(self) -> None:
+        """预先构建索引、分词统计和转换表，第一次请求不必等待。"""
+        with self._lock, _stage("serve.warm"):
+            self.books.ci_index
+            self.books.zi_index
+            self.books.fuzzy_index
+            self.lat2han
+            self.han2lat
+
+    @property
+    def lat2han(self) -> Lat2Han:
+        if self._lat2han is None:
+            fenci = self._fenci
+            if isinstance(fenci, str):
+                fenci = load_fenci_csv(fenci)
+            self._lat2han = Lat2Han(fenci if fenci is not None else self.books.fenci())
+        return self._lat2han
+
+    @property
+    def han2lat(self) -> Han2Lat:
+        if self._han2lat is None:
+            self._han2lat = Han2Lat(self.books.fenci(zi=True))
+        return self._han2lat
+
+    def _verse_json(verse: Verse|None) -> dict|None:
+        return None if verse is None else {"line_no": verse.line_no, "lat": verse.lat, "han": verse.han}
+
+    def _int(name: str, value) -> int:
+        """把参数转为整数。GET 请求的参数都是字符串。"""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ServiceError(400, f"{name} 须为整数: {value!r}") from None
+
+    def _api_status(self) -> dict:
+        return {"books": len(self.books), "uptime": round(time.time() - self.started, 1),
+                "requests": dict(self.requests)}
+
+    def _api_verse(self, book, chapter, verse) -> dict:
+        if not isinstance(book, (int, str)):
+            raise ServiceError(400, f"book 须为编号或书名: {book!r}")
+        if Books._book_no(book) is None:
+            raise ServiceError(404, f"找不到这本书: {book}")
+        (chapter, verse) = (CorpusService._int("chapter", chapter), CorpusService._int("verse", verse))
+        # 找不到时 `get_verse()` 会输出提示，这里改为返回给客户端
+        (found, output) = _call_captured(self.books.get_verse, book, chapter, verse)
+        if found is None:
+            raise ServiceError(404, output.strip() or "未找到该小节！")
+        return CorpusService._verse_json(found)
+
+    def _api_verses(self, refs: str) -> list[dict]:
+        return [{"ref": str(ref), "text": ref.text, "verses": [CorpusService._verse_json(v) for v in verses]}
+                for (ref, verses) in self.books.get_verses(refs)]
+
+    def _api_search_ci(self, lat: str=None, han: str=None) -> list[list]:
+        if lat is None and han is None:
+            raise ServiceError(400, "lat 和 han 至少需要给出一个。")
+        return [list(posting) for posting in self.books.search_ci(lat, han)]
+
+    def _api_search_zi(self, lat: str=None, han: str=None) -> list[list]:
+        if lat is None and han is None:
+            raise ServiceError(400, "lat 和 han 至少需要给出一个。")
+        return [list(posting) for posting in self.books.search_zi(lat, han)]
+
+    def _api_translations(self, lat: str) -> dict[str, int]:
+        return dict(self.books.ci_index.translations(lat).most_common())
+
+    def _api_readings(self, han: str) -> dict[str, int]:
+        return dict(self.books.ci_index.readings(han).most_common())
+
+    def _api_fuzzy(self, query: str, max_distance: int=2, limit: int=10) -> list[list]:
+        (max_distance, limit) = (CorpusService._int("max_distance", max_distance), CorpusService._int("limit", limit))
+        return [list(match) for match in self.books.search_fuzzy(query, max_distance, limit)]
+
+    def _api_lat2han(self, text: "str|list[str]") -> "str|list[str]":
+        if isinstance(text, str):
+            return self.lat2han.translate(text)
+        return self.lat2han.translate_many(text)
+
+    def _api_han2lat(self, text: "str|list[str]") -> "str|list[str]":
+        if isinstance(text, str):
+            return self.han2lat.translate(text)
+        return self.han2lat.translate_many(text)
+
+    def _api_validate(self, text: str=None, paths: list[str]=None) -> list[dict]:
+        """检查原文标点。`text` 为原文格式的若干行，`paths` 为服务器上的原文路径。"""
+        diagnostics = []
+        if text is not None:
+            for no, line in enumerate(text.splitlines(), 1):
+                for (column, rule, message) in _check_punc_line(line.strip()):
+                    diagnostics.append(PuncDiagnostic("<text>", no, column, rule, message))
+        if paths:
+            missing = [path for path in paths if not os.path.isfile(path)]
+            if missing:
+                raise ServiceError(404, f"找不到文件: {', '.join(missing)}")
+            diagnostics.extend(check_origin_punc(*paths))
+        return [diagnostic._asdict() for diagnostic in diagnostics]
+
+    def _api_mismatches(self) -> list[list]:
+        mismatches = []
+        self.books.fenci(mismatches=mismatches)
+        return [list(mismatch) for mismatch in mismatches]
+
+
+class _CorpusRequestHandler(http.server.BaseHTTPRequestHandler):
+    """`GET /接口?参数=值` 或 `POST /接口`（JSON 参数），返回 JSON。"""
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        self._respond(url.path, dict(urllib.parse.parse_qsl(url.query)))
+
+    def do_POST(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            params = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send(400, {"error": "请求内容不是有效的 JSON"})
+        if not isinstance(params, dict):
+            return self._send(400, {"error": "参数须为 JSON 对象"})
+        self._respond(url.path, params)
+
+    def _respond(self, path: str, params: dict) -> None:
+        try:
+            result = self.server.service.call(path.strip("/"), params)
+        except ServiceError as e:
+            return self._send(e.status, {"error": str(e)})
+        except Exception as e:
+            # 服务本身的问题，不能当作请求有误：在服务器上输出 traceback，客户端收到 500
+            traceback.print_exc()
+            return self._send(500, {"error": f"服务内部错误: {type(e).__name__}: {e}"})
+        self._send(200, {"result": result})
+
+    def _send(self, status: int, body: dict) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class CorpusServer(http.server.ThreadingHTTPServer):
+    """本机 JSON 查询服务。只监听 127.0.0.1，每个连接一个线程。
+
+    使用方式:
+        `python tool.py serve 漢字對照/*.md --fenci fenci.csv`   # 命令行
+        `server = CorpusServer(books); server.start()`          # 在 notebook 中后台运行
+    客户端见 `CorpusClient`。接口即 `CorpusService` 中的 `_api_*` 方法。
+    """
+
+    daemon_threads = True
+
+    def __init__(self, books: Books, fenci: "Counter|str"=None, origin_paths=(),
+                 port: int=8765, verbose: bool=False) -> None:
+        super().__init__(("127.0.0.1", port), _CorpusRequestHandler)
+        self.service = CorpusService(books, fenci, origin_paths)
+        self.verbose = verbose
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        (host, port) = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def run(self) -> None:
+        """一直运行，直到按 Ctrl+C 或调用 `stop()`。"""
+        self.service.warm()
+        print(f"🟢 语料服务已启动: {self.url}，按 Ctrl+C 结束。")
+        try:
+            self.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+    def start(self) -> None:
+        """在后台线程中运行。"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.service.warm()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止服务并释放端口。"""
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class CorpusClient:
+    """`CorpusServer` 的客户端，方法与 `Books` 等的同名方法返回相同类型的结果。
+
+        `client = CorpusClient()`
+        `client.get_verse(1, 4, 1)`
+        `client.search_ci("Yia-su", "耶穌")`
+    """
+
+    def __init__(self, url: str="http://127.0.0.1:8765", timeout: float=30) -> None:
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def call(self, endpoint: str, **params):
+        """调用一个接口，返回其结果。服务返回错误时抛出 `ServiceError`（`RuntimeError` 的子类）。"""
+        request = urllib.request.Request(f"{self.url}/{endpoint}",
+                                         data=json.dumps(params, ensure_ascii=False).encode("utf-8"),
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                body = json.load(response)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.load(e).get('error', e.reason)
+            except ValueError:
+                message = e.reason
+            raise ServiceError(e.code, f"{endpoint}: {message}") from None
+        return body["result"]
+
+    def _posting(row: list) -> CiPosting:
+        return CiPosting(*row[:5], tuple(row[5]), tuple(row[6]))
+
+    def _verse(data: dict|None) -> Verse|None:
+        return None if data is None else Verse(data["line_no"], data["lat"], data["han"])
+
+    def status(self) -> dict:
+        return self.call("status")
+
+    def get_verse(self, book_no: int|str, chapter_no: int, verse_no: int) -> Verse|None:
+        """同 `Books.get_verse()`，找不到时返回 `None`。"""
+        try:
+            return CorpusClient._verse(self.call("verse", book=book_no, chapter=chapter_no, verse=verse_no))
+        except ServiceError as e:
+            if e.status != 404:
+                raise
+            print(str(e).removeprefix("verse: "))
+            return None
+
+    def get_verses(self, refs: str) -> list[tuple[str, list[Verse]]]:
+        """返回 [(引用, [Verse, ...]), ...]。引用为 `str(Reference)` 的形式。"""
+        return [(item["ref"], [CorpusClient._verse(v) for v in item["verses"]])
+                for item in self.call("verses", refs=refs)]
+
+    def search_ci(self, lat_ci: str=None, han_ci: str=None) -> list[CiPosting]:
+        return [CorpusClient._posting(row) for row in self.call("search_ci", lat=lat_ci, han=han_ci)]
+
+    def search_zi(self, lat: str=None, han: str=None) -> list[CiPosting]:
+        return [CorpusClient._posting(row) for row in self.call("search_zi", lat=lat, han=han)]
+
+    def translations(self, lat_ci: str) -> Counter:
+        return Counter(self.call("translations", lat=lat_ci))
+
+    def readings(self, han_ci: str) -> Counter:
+        return Counter(self.call("readings", han=han_ci))
+
+    def search_fuzzy(self, query: str, max_distance: int=2, limit: int=10) -> list[FuzzyMatch]:
+        return [FuzzyMatch(*row) for row in self.call("fuzzy", query=query, max_distance=max_distance, limit=limit)]
+
+    def lat2han(self, text: "str|list[str]") -> "str|list[str]":
+        return self.call("lat2han", text=text)
+
+    def han2lat(self, text: "str|list[str]") -> "str|list[str]":
+        return self.call("han2lat", text=text)
+
+    def validate(self, text: str=None, paths: list[str]=None) -> list[PuncDiagnostic]:
+        return [PuncDiagnostic(**item) for item in self.call("validate", text=text, paths=paths)]
+
+    def find_mismatches(self) -> list[Mismatch]:
+        return [Mismatch(*row) for row in self.call("mismatches")]
 
 
 class book_names:
 
     def find_book_no(book_name:str)-> int|None:
-        book_name = book_name.strip().rstrip('.').lower()
+        """根据书名或简称查找书的编号（从 1 开始），找不到时返回 `None`。
 
-        for no, keywords in book_names.no_and_keywords:
-            if book_name in keywords:
-                return no
-        return None
+        不区分大小写，忽略空格、`.` 和撇号，如 "1 I'ö."、"1iö" 都能找到 约翰一书；
+        罗马字书名可以省略附加符号，如 "1 io"，有歧义的写法则不收录。
+        """
+        key = book_names.normalize(book_name)
+        book_no = book_names.alias_index.get(key)
+        if book_no is None:
+            # 省略了附加符号或用 uy/ov/oa/ae 输入的，如 "1 io"、"1 ioa"
+            book_no = book_names.folded_alias_index.get(fold_lat(key))
+        return book_no
+
+    _re_ignored = re.compile(r"[\s.'‘’]+")
+
+    def normalize(book_name:str) -> str:
+        """统一书名的写法，用于查找。"""
+        return book_names._re_ignored.sub("", book_name.lower())
+
+    SINGLE_CHAPTER = frozenset((18, 24, 25, 26))    # 只有一章的书，引用时可省略章
 
     no_and_keywords = {
         1 :  ('太', 'matt', '马太', '馬太', '马太福音', '馬太福音', '马太传福音书', '馬太傳福音書', "mô-t'a djün foh-ing shü", 'mt') ,
@@ -644,7 +3716,7 @@ class book_names:
         13 :  ('帖前', '1 thess', '帖撒前', '帖撒1', '帖撒一', '帖撒上', '帖撒罗尼迦前', '帖撒羅尼迦前', '帖撒罗尼迦书信 1', '帖撒羅尼迦書信 1', "1 t'ih-sæh-lo-nyi-kô shü-sing", '1 t') ,
         14 :  ('帖後', '帖后', '2 thess', '帖撒后', '帖撒後', '帖撒2', '帖撒二', '帖撒下', '帖撒罗尼迦后', '帖撒羅尼迦後', '帖撒罗尼迦书信 2', '帖撒羅尼迦書信 2', "2 t'ih-sæh-lo-nyi-kô shü-sing", '2 t') ,
         15 :  ('提前', '1 tim', '提摩太前', '提摩太1', '提摩太一', '提摩太上', '提摩太书信 1', '提摩太書信 1', "1 di-mo-t'a shü-sing", '1d') ,
-        16 :  ('提後', '提后', '2 tim', '提摩太后', '提摩太後', '提摩太1', '提摩太二', '提摩太下', '提摩太书信 2', '提摩太書信 2', "2 di-mo-t'a shü-sing", '2d') ,
+        16 :  ('提後', '提后', '2 tim', '提摩太后', '提摩太後', '提摩太2', '提摩太二', '提摩太下', '提摩太书信 2', '提摩太書信 2', "2 di-mo-t'a shü-sing", '2d') ,
         17 :  ('多', 'titus', '提多', '提多书信', '提多書信', 'di-to shü-sing', 'dt') ,
         18 :  ('門', '门', 'philem', '腓利门', '腓利門', '腓利门书信', '腓利門書信', 'fi-li-meng shü-sing', 'flm') ,
         19 :  ('來', '来', 'heb', '希伯来', '希伯來', '希伯来书信', '希伯來書信', 'hyi-pah-le shü-sing', 'h') ,
@@ -657,3 +3729,220 @@ class book_names:
         26 :  ('猶', '犹', 'jude', '犹大', '猶大', '犹大书信', '猶大書信', 'yiu-da shü-sing', 'yd') ,
         27 :  ('啟', '启', 'rev', '啓', '默',  '启示录', '啟示錄', '啓示錄', '默示录', '默示錄', "iah-'ön-keh moh-z-loh", 'mz') ,
     }
+
+    # {统一写法后的书名: 编号}，由 `no_and_keywords` 生成
+    alias_index = {}
+    # {去掉附加符号后的书名: 编号}，不含有歧义的写法
+    folded_alias_index = {}
+
+
+def _build_alias_index() -> dict[str, int]:
+    index = {}
+    for (no, keywords) in book_names.no_and_keywords.items():
+        for keyword in keywords:
+            key = book_names.normalize(keyword)
+            if index.setdefault(key, no) != no:
+                raise ValueError(f"书名简称重复: {keyword!r}")
+    return index
+
+def _build_folded_alias_index(alias_index: dict[str, int]) -> dict[str, int]:
+    index = {}
+    ambiguous = set()
+    for (key, no) in alias_index.items():
+        folded = fold_lat(key)
+        if index.setdefault(folded, no) != no:
+            ambiguous.add(folded)
+    for folded in ambiguous:
+        del index[folded]
+    return index
+
+book_names.alias_index = _build_alias_index()
+book_names.folded_alias_index = _build_folded_alias_index(book_names.alias_index)
+
+
+class Reference(NamedTuple):
+    """一条经文引用，由 `parse_refs()` 生成。
+
+    `verse_no` 为 `None` 时表示整章，此时 `end_verse_no` 也为 `None`，
+    范围是 `chapter_no` 到 `end_chapter_no` 的各章（不含概述小节）。
+    """
+    text: str               # 原始写法
+    book_no: int
+    chapter_no: int
+    verse_no: int|None
+    end_chapter_no: int
+    end_verse_no: int|None
+
+    def __str__(self) -> str:
+        if self.verse_no is None:
+            if self.end_chapter_no == self.chapter_no:
+                return f"{self.book_no}.{self.chapter_no}"
+            return f"{self.book_no}.{self.chapter_no}-{self.end_chapter_no}"
+        start = f"{self.book_no}.{self.chapter_no}.{self.verse_no}"
+        if (self.end_chapter_no, self.end_verse_no) == (self.chapter_no, self.verse_no):
+            return start
+        if self.end_chapter_no == self.chapter_no:
+            return f"{start}-{self.end_verse_no}"
+        return f"{start}-{self.end_chapter_no}.{self.end_verse_no}"
+
+
+# 章节部分：5 | 5.3 | 5:3 | 5.3-8 | 5.3-6.2 | 5-6 | 5.3,7,9-10
+_re_ref_spec = re.compile(r"(\d+)(?:\s*[.:]\s*(\d+))?(?:\s*[-–]\s*(\d+)(?:\s*[.:]\s*(\d+))?)?"
+                          r"((?:\s*,\s*\d+(?:\s*[-–]\s*\d+)?)*)\s*\.?\s*$")
+_re_ref_extra = re.compile(r"(\d+)(?:\s*[-–]\s*(\d+))?")
+
+def parse_refs(text: str) -> list[Reference]:
+    """解析以 `;` 或 `；` 分隔的经文引用，如 "Mk. 1.2-8; 太 5:3"、"1 iö 2.1"、"Mt.10.10;Lk.10.7."。
+
+    书名可用 `book_names` 中的任一写法；省略书名时沿用上一条的书。
+    只有一章的书可以省略章，如 "Yd. 5" 表示 犹大书 第 5 节。
+    `5.3,7` 这样用逗号列出的小节会拆成多条。
+    无法解析的部分会输出提示并跳过。
+    """
+    refs = []
+    book_no = None
+    for part in re.split(r"[;；\n]", text):
+        part = part.strip()
+        if not part:
+            continue
+        match = _re_ref_spec.search(part)
+        book_text = part[:match.start()] if match else part
+        if book_text.strip():
+            book_no = book_names.find_book_no(book_text)
+        if match is None or book_no is None:
+            print(f"🔴 无法解析引用: {part}")
+            if book_text.strip():
+                book_no = None  # 书名有误时，后面省略书名的引用也不再沿用
+            continue
+        (chapter, verse, end_a, end_b, extra) = match.groups()
+        chapter = int(chapter)
+        if book_no in book_names.SINGLE_CHAPTER and verse is None:
+            # 只有一章：Yd. 5、Yd. 5-8
+            refs.append(Reference(part, book_no, 1, chapter, 1, int(end_a) if end_a else chapter))
+        elif verse is None:
+            end_chapter = int(end_a) if end_a else chapter
+            refs.append(Reference(part, book_no, chapter, None, end_chapter, None))
+        else:
+            verse = int(verse)
+            if end_b is not None:       # 5.3-6.2
+                (end_chapter, end_verse) = (int(end_a), int(end_b))
+            elif end_a is not None:     # 5.3-8
+                (end_chapter, end_verse) = (chapter, int(end_a))
+            else:
+                (end_chapter, end_verse) = (chapter, verse)
+            refs.append(Reference(part, book_no, chapter, verse, end_chapter, end_verse))
+        # 逗号后的小节都属于最后提到的章
+        last_chapter = refs[-1].end_chapter_no
+        for (start, end) in _re_ref_extra.findall(extra):
+            start = int(start)
+            end = int(end) if end else start
+            refs.append(Reference(part, book_no, last_chapter, start, last_chapter, end))
+    return refs
+
+
+def main(argv: list[str]=None) -> int:
+    """命令行入口。`python tool.py -h` 查看用法。"""
+    parser = argparse.ArgumentParser(prog="tool.py", description="台州羅馬字聖經 文本工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    punc = subparsers.add_parser("punc", help="检查原文标点，发现问题时返回 1")
+    punc.add_argument("paths", nargs="+", help="原文文本路径")
+    punc.add_argument("--json", action="store_true", help="以 JSON lines 格式输出")
+    punc.add_argument("--workers", type=int, default=None, help="进程数")
+
+    watch = subparsers.add_parser("watch", help="监视文件，保存后只处理改动的行")
+    watch.add_argument("--origin", nargs="*", default=[], help="原文文本路径")
+    watch.add_argument("--trans", nargs="*", default=[], help="译文文本路径")
+    watch.add_argument("--interval", type=float, default=1.0, help="轮询间隔（秒）")
+
+    db = subparsers.add_parser("db", help="把译文导出到 SQLite 数据库，只重写改动过的书")
+    db.add_argument("db_path", help="数据库路径")
+    db.add_argument("paths", nargs="+", help="译文文本路径")
+    db.add_argument("--force", action="store_true", help="全部重新导出")
+
+    kwic = subparsers.add_parser("kwic", help="生成全部分词的索引（KWIC），输出为 Markdown 或 CSV")
+    kwic.add_argument("output", help="输出路径，扩展名为 .csv 时输出 CSV")
+    kwic.add_argument("paths", nargs="+", help="译文文本路径")
+    kwic.add_argument("--fenci", help="只列出该分词 CSV 文件中的词")
+    kwic.add_argument("--width", type=int, default=30, help="原文左右各保留的字符数")
+    kwic.add_argument("--sort", choices=("ref", "left", "right"), default="ref", help="组内排序方式")
+
+    serve = subparsers.add_parser("serve", help="在本机启动 JSON 查询服务，常驻内存")
+    serve.add_argument("paths", nargs="+", help="译文文本路径")
+    serve.add_argument("--origin", nargs="*", default=[], help="同时监视的原文文本路径")
+    serve.add_argument("--fenci", help="lat2han 使用的分词 CSV 文件，默认使用译文的分词统计")
+    serve.add_argument("--port", type=int, default=8765, help="端口")
+    serve.add_argument("--verbose", action="store_true", help="输出每个请求")
+
+    variants = subparsers.add_parser("variants", help="生成写法一致性报告（Markdown）")
+    variants.add_argument("output", help="输出路径")
+    variants.add_argument("paths", nargs="+", help="译文文本路径")
+    variants.add_argument("--by", choices=("lat", "han"), default="lat",
+                          help="lat: 同一罗马字词的不同汉字写法；han: 同一汉字词的不同拼法")
+    variants.add_argument("--sort", choices=("entropy", "minority"), default="entropy", help="排序方式")
+    variants.add_argument("--min-count", type=int, default=2, help="至少出现的次数")
+
+    drift = subparsers.add_parser("drift", help="检查译文文件中的原文行是否与原文一致，有差异时返回 1")
+    drift.add_argument("origin_dir", help="原文目录")
+    drift.add_argument("trans_dir", help="译文目录")
+    drift.add_argument("--patch", action="store_true", help="把改动过的原文行写回译文文件")
+
+    args = parser.parse_args(argv)
+    if args.command == "punc":
+        if args.json:
+            diagnostics = []
+            for file_diagnostics in _map_books(check_origin_punc, args.paths, args.workers):
+                diagnostics.extend(file_diagnostics)
+            write_diagnostics_jsonl(diagnostics, sys.stdout)
+        else:
+            diagnostics = validate_origin_puncs(*args.paths, workers=args.workers)
+        return 1 if diagnostics else 0
+    elif args.command == "watch":
+        books = load_trans_books(*args.trans)
+        if books is None:
+            return 1
+        Watcher(books, args.origin, args.interval).run()
+    elif args.command == "db":
+        books = load_trans_books(*args.paths)
+        if books is None:
+            return 1
+        try:
+            corpus_db = CorpusDB(args.db_path)
+        except ValueError as e:
+            print(f"🔴 {e}")
+            return 1
+        with corpus_db:
+            updated = corpus_db.export(books, force=args.force)
+        print(f"已完成，更新了 {updated} 本书，请查看 {args.db_path}")
+    elif args.command == "kwic":
+        books = load_trans_books(*args.paths)
+        if books is None:
+            return 1
+        vocab = load_fenci_csv(args.fenci) if args.fenci else None
+        count = write_concordance(books, args.output, vocab, args.width, args.sort)
+        print(f"已完成，共 {count} 行，请查看 {args.output}")
+    elif args.command == "variants":
+        books = load_trans_books(*args.paths)
+        if books is None:
+            return 1
+        count = write_variants_report(books, args.output, args.by, args.min_count, args.sort)
+        print(f"已完成，共 {count} 个词有多种写法，请查看 {args.output}")
+    elif args.command == "drift":
+        drifts = check_drift_dirs(args.origin_dir, args.trans_dir)
+        if args.patch and drifts:
+            print(f"已写回 {patch_drift(drifts)} 行")
+            drifts = [drift for drift in drifts if drift.kind != "modified"]
+        return 1 if drifts else 0
+    elif args.command == "serve":
+        books = load_trans_books(*args.paths)
+        if books is None:
+            return 1
+        with CorpusServer(books, args.fenci, args.origin, args.port, args.verbose) as server:
+            server.run()
+    return 0
+
+
+_profile_from_env()
+
+if __name__ == "__main__":
+    sys.exit(main())